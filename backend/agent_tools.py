@@ -1,20 +1,58 @@
 import json
 import os
+import uuid
 import asyncio
 from web3 import Web3
 
 # Import services
 from services.scoring import calculate_trust_score 
-from services.prover import generate_zk_proof 
+from services.prover import generate_zk_proof, address_to_decimal, warm_up_prover
+from services.ondemand import analyze_document
+from services.admission import gate, StageOverloaded
+from services.indexer import verification_index, decimal_to_address
+from services.idempotency import claim_notarization, complete_notarization, record_notary_transaction
+from database import SessionLocal, AnalysisSession
+from pipeline import Pipeline, Node
 
 # --- BLOCKCHAIN SELECTION ---
 # Try importing Solana first, fall back to Mock
 try:
-    from services.blockchain_solana import submit_proof_on_solana
+    from services.blockchain_solana import submit_proof_on_solana, prefetch_blockhash, get_signature_state
 except ImportError:
     print("⚠️ Solana service not found. Using Mock.")
-    def submit_proof_on_solana(proof_data, public_signals):
+    def submit_proof_on_solana(proof_data, public_signals, encoded=None, timeout=None, on_signed=None):
         return {"tx_hash": "0xMOCK_SOLANA_SIG", "status": "success", "network": "MockSolana"}
+    def prefetch_blockhash():
+        return None
+    def get_signature_state(signature):
+        return "pending"
+
+from services.blockchain import submit_proof_on_chain, get_transaction_state
+
+# --- NOTARY FAN-OUT ---
+# NOTARY_CHAINS=solana,evm submits to every listed chain concurrently.
+# NOTARY_POLICY=first returns on the first confirmation; the rest finish in the background.
+# "evm" only lands proofs the contract accepts: threshold >= 700 and the proof wallet must be
+# the gas key's own address (Sentinel.sol checks msg.sender). The agent proves threshold 500
+# for user wallets, so keep evm out of NOTARY_CHAINS until a relayer-aware contract is deployed.
+CHAIN_SUBMITTERS = {
+    "solana": submit_proof_on_solana,
+    "evm": submit_proof_on_chain,
+}
+# Used to resolve stale claims: 'landed', 'dropped' or 'pending'
+CHAIN_TX_STATES = {
+    "solana": get_signature_state,
+    "evm": get_transaction_state,
+}
+NOTARY_CHAINS = [c.strip() for c in os.getenv("NOTARY_CHAINS", "solana").split(",") if c.strip() in CHAIN_SUBMITTERS]
+NOTARY_POLICY = os.getenv("NOTARY_POLICY", "all")
+NOTARY_TIMEOUTS = {
+    "solana": float(os.getenv("NOTARY_TIMEOUT_SOLANA", "30")),
+    "evm": float(os.getenv("NOTARY_TIMEOUT_EVM", "90")),
+}
+
+# Strong references to background submissions so they are not garbage collected
+_background_notaries = set()
 
 # --- AGENT 3: THE RISK OFFICER ---
 def run_risk_analysis_agent(interview_data: dict, auditor_data: dict):
@@ -73,26 +111,85 @@ def run_scoring_agent(risk_data: dict, financials: dict):
     }
 
 # --- AGENT 5: THE CRYPTOGRAPHER ---
-async def run_crypto_agent(score: int, wallet_address: str):
+async def run_crypto_agent(score: int, wallet_address: str, address_decimal: str = None):
     print(f"🔐 Agent 5 (Cryptographer): Generating ZK-Proof for score {score}...")
     
     if not wallet_address:
         return {"status": "error", "message": "Wallet address missing"}
 
     try:
-        proof_result = await generate_zk_proof(
-            credit_score=score, 
-            file_content_str="agent_generated", 
-            wallet_address=wallet_address,
-            threshold=500
-        )
+        # Bounded: each proof is two CPU-heavy subprocesses
+        async with gate("prover").slot():
+            proof_result = await generate_zk_proof(
+                credit_score=score, 
+                file_content_str="agent_generated", 
+                wallet_address=wallet_address,
+                threshold=500,
+                address_decimal=address_decimal
+            )
         return proof_result
+    except StageOverloaded:
+        raise
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
+# --- AGENT 6: THE NOTARY (MULTI-CHAIN) ---
+def _transaction_state(chain: str, tx_hash: str) -> str:
+    return CHAIN_TX_STATES[chain](tx_hash)
+
+async def _notarize_on(chain: str, proof: dict, public_signals: list, encoded: dict, idempotency_key: str = None):
+    """Submits to one chain under its own timeout. Never raises except on overload."""
+    # The hash is on the claim before anything is sent, so a stale claim can be resolved
+    on_signed = (lambda tx_hash: record_notary_transaction(idempotency_key, chain, tx_hash)) if idempotency_key else None
+    try:
+        async with gate("notary").slot():
+            # Blocking RPC, run off the event loop. The submitter enforces the timeout
+            # itself, so the slot stays held until its thread has really finished.
+            tx_result = await asyncio.to_thread(
+                CHAIN_SUBMITTERS[chain],
+                proof_data=proof,
+                public_signals=public_signals,
+                encoded=encoded,
+                timeout=NOTARY_TIMEOUTS.get(chain, 60),
+                on_signed=on_signed
+            )
+    except StageOverloaded:
+        raise
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
-# --- AGENT 6: THE NOTARY (UPDATED FOR SOLANA) ---
-async def run_notary_agent(proof_data: dict):
-    print(f"📜 Agent 6 (Notary): Minting credential on Solana...")
+    # Make the memo visible to /verification-status before it finalizes
+    if chain == "solana" and tx_result.get("status") == "success" and len(public_signals) > 1:
+        try:
+            await asyncio.to_thread(
+                verification_index.record_solana_submission,
+                decimal_to_address(public_signals[1]),
+                tx_result["tx_hash"],
+                public_signals[0]
+            )
+        except Exception as e:
+            print(f"⚠️ Indexer record failed: {e}")
+    return tx_result
+
+def _summarize(results: dict) -> dict:
+    """success: no chain failed | partial: some succeeded | error: all failed | unconfirmed: only timeouts."""
+    statuses = [r.get("status") for r in results.values()]
+    succeeded = [chain for chain, r in results.items() if r.get("status") == "success"]
+    if succeeded and all(s in ("success", "pending") for s in statuses):
+        status = "success"
+    elif succeeded:
+        status = "partial"
+    elif all(s == "error" for s in statuses):
+        status = "error"
+    else:
+        status = "unconfirmed"
+
+    # Primary chain's fields stay at the top level for existing clients
+    primary = results[succeeded[0]] if succeeded else {}
+    return {**primary, "status": status, "chains": results}
+
+async def run_notary_agent(proof_data: dict, idempotency_key: str = None, fingerprint: str = None):
+    print(f"📜 Agent 6 (Notary): Minting credential on {', '.join(NOTARY_CHAINS)}...")
     
     if proof_data.get("status") == "error":
         return {"status": "skipped", "reason": "Proof generation failed previously."}
@@ -102,10 +199,171 @@ async def run_notary_agent(proof_data: dict):
 
     if not proof or not public_signals:
         return {"status": "error", "message": "Invalid Proof Data"}
+    if not NOTARY_CHAINS:
+        return {"status": "skipped", "reason": "No notary chains configured."}
+
+    # Never notarize the same request twice, even across retries and restarts
+    if idempotency_key:
+        wallet = decimal_to_address(public_signals[1]) if len(public_signals) > 1 else None
+        prior = await asyncio.to_thread(claim_notarization, idempotency_key, fingerprint, wallet, _transaction_state)
+        if prior is not None:
+            print(f"♻️ Notary: {idempotency_key[:12]} already submitted. Reusing result.")
+            return {**prior, "deduplicated": True}
+
+    encoded = proof_data.get("encoded")
+    tasks = {
+        chain: asyncio.create_task(_notarize_on(chain, proof, public_signals, encoded, idempotency_key))
+        for chain in NOTARY_CHAINS
+    }
+    chain_of = {task: chain for chain, task in tasks.items()}
+    results = {chain: {"status": "pending"} for chain in tasks}
+
+    async def finish():
+        # Waits for every chain, then records the final outcome for deduplication
+        summary = {"status": "error", "message": "Notary did not complete"}
+        try:
+            for chain, task in tasks.items():
+                try:
+                    results[chain] = await task
+                except StageOverloaded:
+                    results[chain] = {"status": "error", "message": "Notary overloaded", "sent": False}
+            summary = _summarize(results)
+            return summary
+        finally:
+            if idempotency_key:
+                await asyncio.to_thread(complete_notarization, idempotency_key, summary)
+
+    if NOTARY_POLICY == "first" and len(tasks) > 1:
+        pending = set(tasks.values())
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                results[chain_of[task]] = task.result() if not task.exception() else {
+                    "status": "error", "message": str(task.exception()),
+                    "sent": False if isinstance(task.exception(), StageOverloaded) else None
+                }
+            if any(r.get("status") == "success" for r in results.values()):
+                break
+
+        if pending:
+            # Return now; the remaining chains keep going in the background
+            background = asyncio.create_task(finish())
+            _background_notaries.add(background)
+            background.add_done_callback(_background_notaries.discard)
+            return _summarize(results)
+
+    return await finish()
+
+# --- ORCHESTRATION GRAPH ---
+# Each agent is a node; independent nodes (input parsing, prover warm-up,
+# blockhash prefetch, the auditor) start together instead of in sequence.
+class InvalidPipelineInput(ValueError):
+    """Request inputs the pipeline cannot run with; raised before any agent does work."""
 
+
+def _parse_inputs(ctx: dict):
+    inputs = ctx["inputs"]
+    claimed = inputs.get("claimed_income")
+    wallet = (inputs.get("wallet_address") or "").strip()
+    if not Web3.is_address(wallet):
+        raise InvalidPipelineInput(f"Invalid wallet address: {wallet!r}")
+    address_decimal = address_to_decimal(wallet)
+    return {
+        "claimed_income": int(claimed) if claimed and claimed.isdigit() else None,
+        "address_decimal": address_decimal
+    }
+
+def _warm_prover(ctx: dict):
+    try:
+        return warm_up_prover()
+    except Exception as e:
+        print(f"⚠️ Prover warm-up failed: {e}")
+        return False
+
+def _prefetch_blockhash(ctx: dict):
+    # Best effort: the notary fetches its own blockhash if this fails
+    try:
+        return prefetch_blockhash()
+    except Exception as e:
+        print(f"⚠️ Blockhash prefetch failed: {e}")
+        return None
+
+async def _audit(ctx: dict):
+    inputs = ctx["inputs"]
+    async with gate("auditor").slot():
+        return await asyncio.to_thread(analyze_document, inputs["auditor_agent_id"], inputs["file_path"])
+
+def _interview(ctx: dict):
+    # AGENT 1 (Interviewer) data: the stated income, or the audited total if none was given
+    claimed = ctx["parse_inputs"]["claimed_income"]
+    if claimed is None:
+        claimed = ctx["auditor"].get("verified_ledger_total", 0)
+    return {"reported_income": claimed}
+
+def _risk(ctx: dict):
+    return run_risk_analysis_agent(ctx["interview"], ctx["auditor"])
+
+def _score(ctx: dict):
+    return run_scoring_agent(ctx["risk"], ctx["auditor"])
+
+async def _crypto(ctx: dict):
+    return await run_crypto_agent(
+        ctx["score"]["credit_score"],
+        ctx["inputs"]["wallet_address"],
+        address_decimal=ctx["parse_inputs"]["address_decimal"]
+    )
+
+def _proof_failed(ctx: dict):
+    if ctx["crypto"].get("status") != "success":
+        return "Proof failed"
+    return None
+
+async def _notary(ctx: dict):
+    inputs = ctx["inputs"]
+    return await run_notary_agent(
+        ctx["crypto"],
+        idempotency_key=inputs.get("idempotency_key"),
+        fingerprint=inputs.get("request_fingerprint")
+    )
+
+def _persist(ctx: dict):
+    # Runs alongside the notary; a DB hiccup must not fail the verification
+    proof = ctx["crypto"]
+    db = SessionLocal()
     try:
-        # Switch to Solana implementation
-        tx_result = submit_proof_on_solana(proof_data=proof, public_signals=public_signals)
-        return tx_result
+        record = AnalysisSession(
+            id=str(uuid.uuid4()),
+            file_hash=ctx["inputs"].get("document_digest"),
+            credit_score=ctx["score"]["credit_score"],
+            risk_level=ctx["risk"]["risk_level"],
+            reasoning=ctx["risk"]["reasoning"],
+            proof_status="generated" if proof.get("status") == "success" else "failed",
+            proof_data=proof.get("encoded")
+        )
+        db.add(record)
+        db.commit()
+        return {"status": "saved", "session_id": record.id}
     except Exception as e:
-        return {"status": "error", "message": str(e)}
\ No newline at end of file
+        db.rollback()
+        print(f"⚠️ Persist Error: {e}")
+        return {"status": "error", "message": str(e)}
+    finally:
+        db.close()
+
+VERIFICATION_PIPELINE = Pipeline([
+    Node("parse_inputs", _parse_inputs),
+    Node("warm_prover", _warm_prover),
+    Node(
+        "prefetch_blockhash", _prefetch_blockhash,
+        skip_if=lambda ctx: None if "solana" in NOTARY_CHAINS else "Solana notary disabled"
+    ),
+    # Waits on parse_inputs (instant) so a bad request never reaches the auditor
+    Node("auditor", _audit, deps=("parse_inputs",)),
+    Node("interview", _interview, deps=("parse_inputs", "auditor")),
+    Node("risk", _risk, deps=("interview", "auditor")),
+    Node("score", _score, deps=("risk", "auditor")),
+    Node("crypto", _crypto, deps=("parse_inputs", "score", "warm_prover")),
+    # No edge to prefetch_blockhash: it finishes long before the proof and only fills a cache
+    Node("notary", _notary, deps=("crypto",), skip_if=_proof_failed),
+    Node("persist", _persist, deps=("crypto", "risk", "score")),
+])
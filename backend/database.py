@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine, Column, Integer, String, JSON, DateTime
+from sqlalchemy import create_engine, Column, Integer, String, JSON, DateTime, Boolean, UniqueConstraint, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
@@ -21,5 +21,45 @@ class AnalysisSession(Base):
     proof_status = Column(String, default="pending") # pending, generated, failed
     proof_data = Column(JSON, nullable=True) # Store the proof here once generated
 
+class VerificationEvent(Base):
+    # Local index of CreditVerified events (EVM) and our Solana memo submissions
+    __tablename__ = "verification_events"
+    __table_args__ = (UniqueConstraint("chain", "tx_hash", "log_index"),)
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    chain = Column(String, index=True) # evm, solana
+    wallet = Column(String, index=True) # lowercase 0x address
+    tx_hash = Column(String)
+    log_index = Column(Integer, default=0)
+    block_number = Column(Integer, index=True, nullable=True) # slot on Solana
+    timestamp = Column(Integer)
+    score_threshold = Column(Integer)
+    confirmed = Column(Boolean, default=False) # past confirmation depth / finalized
+
+class IndexerCursor(Base):
+    # Last block whose events are final (deeper than the confirmation depth)
+    __tablename__ = "indexer_cursors"
+
+    chain = Column(String, primary_key=True)
+    block_number = Column(Integer)
+
+class NotarySubmission(Base):
+    # One row per idempotency key: guarantees a proof is notarized at most once
+    __tablename__ = "notary_submissions"
+
+    idempotency_key = Column(String, primary_key=True)
+    fingerprint = Column(String, nullable=True) # wallet + document the key was first used for
+    transactions = Column(JSON, nullable=True) # {chain: tx hash / signature}, stored before sending
+    created_at = Column(DateTime, default=datetime.utcnow)
+    status = Column(String, default="pending") # pending, success, error, failed
+    result = Column(JSON, nullable=True)
+
 def init_db():
-    Base.metadata.create_all(bind=engine)
\ No newline at end of file
+    Base.metadata.create_all(bind=engine)
+    # create_all never alters existing tables; add columns introduced since
+    columns = {c["name"] for c in inspect(engine).get_columns("notary_submissions")}
+    added = {"fingerprint": "VARCHAR", "transactions": "JSON"}
+    with engine.begin() as conn:
+        for name, sql_type in added.items():
+            if name not in columns:
+                conn.execute(text(f"ALTER TABLE notary_submissions ADD COLUMN {name} {sql_type}"))
\ No newline at end of file
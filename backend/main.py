@@ -1,20 +1,25 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Depends, Request
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Depends, Request, Query, Response
 from pydantic import BaseModel
+from typing import List
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.sessions import SessionMiddleware
 from authlib.integrations.starlette_client import OAuth
 import os
-import shutil
-from starlette.responses import RedirectResponse
-
-from agent_tools import (
-    run_risk_analysis_agent, 
-    run_scoring_agent, 
-    run_crypto_agent, 
-    run_notary_agent
-)
-from services.ondemand import create_chat_session, send_chat_message, analyze_document
+import asyncio
+import hashlib
+import uuid
+from starlette.responses import RedirectResponse, JSONResponse
+
+from agent_tools import VERIFICATION_PIPELINE, InvalidPipelineInput
+from services.ondemand import send_chat_message
 from services.voice import text_to_speech
+from services.admission import gate, readiness, StageOverloaded
+from services.resilience import UPSTREAMS
+from services.indexer import verification_index
+from services.idempotency import pipeline_flight, default_idempotency_key, IdempotencyKeyMismatch, MAX_KEY_LENGTH
+from services.prover import format_proof_result, PROOF_FORMATS
+from services.session_pool import SessionPool
+from database import init_db
 
 # --- CONFIGURATION ---
 # load_dotenv() is called in agent_tools or implicitly by OS, but good to ensure
@@ -50,14 +55,44 @@ oauth.register(
     }
 )
 
+# 3. Admission Control: overloaded stages shed load with a fast 503
+@app.exception_handler(StageOverloaded)
+async def stage_overloaded_handler(request: Request, exc: StageOverloaded):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc), "stage": exc.stage},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
 AGENT_INTERVIEWER_ID = os.getenv("AGENT_INTERVIEWER_ID", "agent-mock")
 AGENT_AUDITOR_ID = os.getenv("AGENT_AUDITOR_ID", "agent-mock")
 
+interview_pool = SessionPool(AGENT_INTERVIEWER_ID)
+
 # --- DATA MODELS ---
 class ChatRequest(BaseModel):
     session_id: str
     message: str
 
+class VerificationStatusRequest(BaseModel):
+    wallets: List[str]
+
+MAX_STATUS_BATCH = int(os.getenv("MAX_STATUS_BATCH", "1000"))
+
+# --- BACKGROUND TASKS ---
+@app.on_event("startup")
+async def setup_database():
+    await asyncio.to_thread(init_db)
+
+@app.on_event("startup")
+async def start_indexer():
+    # Keep a reference so the task is not garbage collected
+    app.state.indexer_task = asyncio.create_task(verification_index.run())
+
+@app.on_event("startup")
+async def start_session_pool():
+    app.state.session_pool_task = asyncio.create_task(interview_pool.run())
+
 # --- AUTH ROUTES ---
 @app.get("/login")
 async def login(request: Request):
@@ -99,12 +134,39 @@ async def logout(request: Request):
     return {"status": "logged_out"}
 
 
+# --- HEALTH ---
+@app.get("/ready")
+async def ready():
+    # Polled by the load balancer: stage queue depths + overall readiness
+    state = readiness()
+    state["upstreams"] = {name: u.snapshot() for name, u in UPSTREAMS.items()}
+    state["interview_sessions"] = interview_pool.size()
+    return JSONResponse(status_code=200 if state["ready"] else 503, content=state)
+
+
+# --- VERIFICATION STATUS (served from the local index, no RPC) ---
+def _status_response(wallets: List[str]):
+    if len(wallets) > MAX_STATUS_BATCH:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_STATUS_BATCH} wallets per request")
+    return {"results": verification_index.lookup(wallets)}
+
+@app.get("/verification-status")
+async def verification_status(wallet: List[str] = Query(...)):
+    return _status_response(wallet)
+
+@app.post("/verification-status")
+async def verification_status_batch(data: VerificationStatusRequest):
+    return _status_response(data.wallets)
+
+
 # --- ORCHESTRATOR ENDPOINT ---
 @app.post("/verify-identity")
 async def verify_identity(
     request: Request,
+    response: Response,
     wallet_address: str = Form(...),
     claimed_income: str = Form(None), 
+    proof_format: str = Form("both"),
     file: UploadFile = File(...)
 ):
     # Optional: Check Auth
@@ -112,58 +174,89 @@ async def verify_identity(
     # if not user:
     #     raise HTTPException(status_code=401, detail="Unauthorized")
 
-    temp_path = f"temp_{file.filename}"
-    
+    if proof_format not in PROOF_FORMATS:
+        raise HTTPException(status_code=422, detail=f"proof_format must be one of {PROOF_FORMATS}")
+
+    client_key = request.headers.get("Idempotency-Key")
+    if client_key is not None and not 0 < len(client_key) <= MAX_KEY_LENGTH:
+        raise HTTPException(status_code=422, detail=f"Idempotency-Key must be 1-{MAX_KEY_LENGTH} characters")
+
+    # Unique per request: concurrent uploads of the same filename must not collide
+    temp_path = f"temp_{uuid.uuid4().hex}_{os.path.basename(file.filename or 'upload')}"
+    handed_off = False
+
     try:
-        print(f"📂 Orchestrator: Starting sequence for {wallet_address}")
-        
-        # 1. Save file locally
+        # 1. Save file locally (hashing as we go for the default idempotency key)
+        digest = hashlib.sha256()
         with open(temp_path, "wb") as f:
-            shutil.copyfileobj(file.file, f)
-        
-        # 2. AGENT 2 (Auditor): Analyze Document via OnDemand
-        auditor_data = analyze_document(AGENT_AUDITOR_ID, temp_path)
-        
-        # 3. Integrate AGENT 1 (Interviewer) Data
-        if claimed_income and claimed_income.isdigit():
-            user_stated_income = int(claimed_income)
-        else:
-            user_stated_income = auditor_data.get("verified_ledger_total", 0)
-
-        interview_data = {
-            "reported_income": user_stated_income
-        }
-
-        # 4. AGENT 3 (Risk): Risk Analysis
-        risk_result = run_risk_analysis_agent(interview_data, auditor_data)
-
-        # 5. AGENT 4 (Scorer): Scoring
-        score_result = run_scoring_agent(risk_result, auditor_data)
-        credit_score = score_result["credit_score"]
-
-        # 6. AGENT 5 (Cryptographer): Proof Generation (Async)
-        proof_result = await run_crypto_agent(credit_score, wallet_address)
-
-        # 7. AGENT 6 (Notary): Solana Submission
-        notary_result = {"status": "skipped", "message": "Proof failed"}
-        if proof_result.get("status") == "success":
-            notary_result = await run_notary_agent(proof_result)
-        
-        return {
-            "status": "success",
-            "orchestration": {
-                "interview": interview_data,
-                "audit": auditor_data,
-                "risk": risk_result,
-                "score": score_result,
-            },
-            "proof_data": proof_result,
-            "blockchain_status": notary_result
-        }
-        
+            while chunk := file.file.read(1 << 20):
+                digest.update(chunk)
+                f.write(chunk)
+
+        # A client key must keep meaning the same wallet + document
+        fingerprint = default_idempotency_key(wallet_address, digest.hexdigest())
+        key = client_key or fingerprint
+
+        def start_pipeline():
+            # Only called for the first request with this key; the run now owns the file
+            nonlocal handed_off
+            handed_off = True
+            return run_pipeline(key, fingerprint, wallet_address, claimed_income, temp_path, digest.hexdigest())
+
+        result, outcome = await pipeline_flight.run(key, start_pipeline, fingerprint=fingerprint)
+        response.headers["Idempotency-Key"] = key
+        if outcome != "leader":
+            print(f"♻️ Orchestrator: {outcome} existing run for {key[:12]}")
+            response.headers["Idempotent-Replayed"] = "true"
+        # Shared result: shape a copy for this caller
+        return {**result, "proof_data": format_proof_result(result["proof_data"], proof_format)}
+
+    except StageOverloaded:
+        raise
+    except (IdempotencyKeyMismatch, InvalidPipelineInput) as e:
+        raise HTTPException(status_code=422, detail=str(e))
     except Exception as e:
         print(f"❌ Orchestrator Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if not handed_off and os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+async def run_pipeline(idempotency_key: str, request_fingerprint: str, wallet_address: str, claimed_income: str, temp_path: str, document_digest: str):
+    try:
+        # Admission: reject fast instead of queueing unbounded work
+        async with gate("pipeline").slot():
+            print(f"📂 Orchestrator: Starting sequence for {wallet_address}")
+
+            # Agents 1-6 as a dependency graph (see agent_tools.VERIFICATION_PIPELINE)
+            run = await VERIFICATION_PIPELINE.run({
+                "wallet_address": wallet_address,
+                "claimed_income": claimed_income,
+                "file_path": temp_path,
+                "auditor_agent_id": AGENT_AUDITOR_ID,
+                "idempotency_key": idempotency_key,
+                "request_fingerprint": request_fingerprint,
+                "document_digest": document_digest
+            })
+            results = run["results"]
+
+            notary_result = results.get("notary") or {
+                "status": "skipped", "message": run["skipped"].get("notary", "Proof failed")
+            }
+
+            return {
+                "status": "success",
+                "orchestration": {
+                    "interview": results["interview"],
+                    "audit": results["auditor"],
+                    "risk": results["risk"],
+                    "score": results["score"],
+                },
+                "proof_data": results["crypto"],
+                "blockchain_status": notary_result,
+                "pipeline": {"timings": run["timings"], "total_ms": run["total_ms"]}
+            }
     finally:
         if os.path.exists(temp_path):
             os.remove(temp_path)
@@ -172,17 +265,18 @@ async def verify_identity(
 
 @app.post("/api/interview/start")
 async def start_interview():
-    # Pass a generic user ID for the session
-    sid = create_chat_session("user_hackathon_1")
-    
-    # Pass the AGENT ID for the query
-    text = send_chat_message(sid, "Hello, please state your name and income.", AGENT_INTERVIEWER_ID)
-    audio = text_to_speech(text) if text else None
+    # Pre-warmed session with the opening exchange already done (falls back to a fresh one)
+    sid, text = await interview_pool.start_session()
+
+    # The greeting audio is usually a TTS cache hit
+    audio = await asyncio.to_thread(text_to_speech, text) if text else None
     
     return {"session_id": sid, "text": text, "audio": audio}
 
 @app.post("/api/interview/chat")
 async def chat(data: ChatRequest):
+    # A session served with the cached greeting may still be sending its opening
+    await interview_pool.opening_sent(data.session_id)
     text = send_chat_message(data.session_id, data.message, AGENT_INTERVIEWER_ID)
     audio = text_to_speech(text) if text else None
     return {"text": text, "audio": audio}
\ No newline at end of file
@@ -0,0 +1,125 @@
+import time
+import asyncio
+from typing import Any, Callable, Dict, List, Optional
+
+
+class SkipNode(Exception):
+    """Raised by a node to short-circuit itself; its dependents are skipped too."""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class Node:
+    """
+    One step of the pipeline.
+    `fn(ctx)` gets the shared context: {"inputs": {...}, "<dep name>": <dep result>, ...}.
+    Sync functions run in a worker thread so they never block the event loop.
+    `skip_if(ctx)` may return a reason string to skip the node without running it.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        fn: Callable[[dict], Any],
+        deps: tuple = (),
+        skip_if: Optional[Callable[[dict], Optional[str]]] = None,
+    ):
+        self.name = name
+        self.fn = fn
+        self.deps = tuple(deps)
+        self.skip_if = skip_if
+
+
+class Pipeline:
+    """
+    Runs a dependency graph of nodes: every node starts as soon as its
+    dependencies finish, so independent branches run concurrently.
+    The first node error cancels the rest of the run and is re-raised.
+    """
+
+    def __init__(self, nodes: List[Node]):
+        self.nodes = {node.name: node for node in nodes}
+        for node in nodes:
+            missing = [d for d in node.deps if d not in self.nodes]
+            if missing:
+                raise ValueError(f"Node '{node.name}' depends on unknown nodes {missing}")
+        self.order = self._topological_order()
+
+    def _topological_order(self) -> List[str]:
+        order, visiting, done = [], set(), set()
+
+        def visit(name):
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f"Cycle in pipeline at '{name}'")
+            visiting.add(name)
+            for dep in self.nodes[name].deps:
+                visit(dep)
+            visiting.discard(name)
+            done.add(name)
+            order.append(name)
+
+        for name in self.nodes:
+            visit(name)
+        return order
+
+    async def run(self, inputs: dict) -> Dict[str, Any]:
+        """Returns {"results": {node: result}, "skipped": {node: reason}, "timings": {node: {...}}}."""
+        ctx: Dict[str, Any] = {"inputs": inputs}
+        skipped: Dict[str, str] = {}
+        timings: Dict[str, dict] = {}
+        tasks: Dict[str, asyncio.Task] = {}
+        origin = time.perf_counter()
+
+        def elapsed_ms(since: float) -> float:
+            return round((time.perf_counter() - since) * 1000, 2)
+
+        async def run_node(node: Node):
+            if node.deps:
+                await asyncio.gather(*(tasks[d] for d in node.deps))
+
+            start = time.perf_counter()
+            reason = next((f"'{d}' was skipped" for d in node.deps if d in skipped), None)
+            if reason is None and node.skip_if:
+                reason = node.skip_if(ctx)
+            if reason:
+                skipped[node.name] = reason
+                timings[node.name] = {"status": "skipped", "start_ms": elapsed_ms(origin), "duration_ms": 0.0}
+                return
+
+            status = "ok"
+            try:
+                if asyncio.iscoroutinefunction(node.fn):
+                    ctx[node.name] = await node.fn(ctx)
+                else:
+                    ctx[node.name] = await asyncio.to_thread(node.fn, ctx)
+            except SkipNode as e:
+                status = "skipped"
+                skipped[node.name] = e.reason
+            except Exception:
+                status = "error"
+                raise
+            finally:
+                timings[node.name] = {
+                    "status": status,
+                    "start_ms": round((start - origin) * 1000, 2),
+                    "duration_ms": elapsed_ms(start),
+                }
+
+        for name in self.order:
+            tasks[name] = asyncio.create_task(run_node(self.nodes[name]))
+
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            # Collect the cancellations so no task exception goes unretrieved
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise
+
+        results = {name: ctx[name] for name in self.order if name in ctx}
+        return {"results": results, "skipped": skipped, "timings": timings, "total_ms": elapsed_ms(origin)}
@@ -0,0 +1,116 @@
+import os
+import asyncio
+from contextlib import asynccontextmanager
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Configuration
+# Each stage gets MAX_INFLIGHT_<STAGE> concurrent slots and MAX_QUEUE_<STAGE>
+# waiters. Anything beyond that is rejected immediately with a 503.
+DEFAULT_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "5"))
+QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "30"))
+
+STAGE_DEFAULTS = {
+    "pipeline": (8, 16),  # Whole /verify-identity runs
+    "auditor": (4, 8),    # OnDemand document uploads
+    "prover": (2, 8),     # Witness + snarkjs subprocesses (CPU bound)
+    "notary": (2, 8),     # On-chain transactions
+}
+
+
+class StageOverloaded(Exception):
+    """Raised when a stage has no free slot and its wait queue is full."""
+
+    def __init__(self, stage: str, retry_after: int):
+        super().__init__(f"Stage '{stage}' is overloaded. Retry in {retry_after}s.")
+        self.stage = stage
+        self.retry_after = retry_after
+
+
+class StageGate:
+    """
+    Bounded admission for a single orchestrator stage.
+    At most `max_inflight` callers run at once and at most `max_queue` wait.
+    """
+
+    def __init__(self, name: str, max_inflight: int, max_queue: int, retry_after: int = DEFAULT_RETRY_AFTER):
+        self.name = name
+        self.max_inflight = max_inflight
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+        # Incremented before any await, so simultaneous arrivals are counted
+        self.admitted = 0
+        self.inflight = 0
+        self.rejected = 0
+        self._sem = asyncio.Semaphore(max_inflight)
+
+    @property
+    def queued(self) -> int:
+        return self.admitted - self.inflight
+
+    @property
+    def saturated(self) -> bool:
+        return self.admitted >= self.max_inflight + self.max_queue
+
+    def _reject(self):
+        self.rejected += 1
+        raise StageOverloaded(self.name, self.retry_after)
+
+    @asynccontextmanager
+    async def slot(self):
+        if self.saturated:
+            self._reject()
+
+        self.admitted += 1
+        try:
+            try:
+                await asyncio.wait_for(self._sem.acquire(), timeout=QUEUE_TIMEOUT)
+            except asyncio.TimeoutError:
+                self._reject()
+
+            self.inflight += 1
+            try:
+                yield
+            finally:
+                self.inflight -= 1
+                self._sem.release()
+        finally:
+            self.admitted -= 1
+
+    def snapshot(self) -> dict:
+        return {
+            "admitted": self.admitted,
+            "inflight": self.inflight,
+            "queued": self.queued,
+            "max_inflight": self.max_inflight,
+            "max_queue": self.max_queue,
+            "rejected": self.rejected,
+        }
+
+
+def _build_gates() -> dict:
+    gates = {}
+    for stage, (inflight, queue) in STAGE_DEFAULTS.items():
+        key = stage.upper()
+        gates[stage] = StageGate(
+            stage,
+            max_inflight=int(os.getenv(f"MAX_INFLIGHT_{key}", inflight)),
+            max_queue=int(os.getenv(f"MAX_QUEUE_{key}", queue)),
+        )
+    return gates
+
+
+GATES = _build_gates()
+
+
+def gate(stage: str) -> StageGate:
+    return GATES[stage]
+
+
+def readiness() -> dict:
+    """Queue depths per stage. Not ready once the pipeline gate is saturated."""
+    return {
+        "ready": not GATES["pipeline"].saturated,
+        "stages": {name: g.snapshot() for name, g in GATES.items()},
+    }
@@ -1,7 +1,13 @@
 import os
 import json
+import time
+import threading
+from typing import Callable
 from web3 import Web3
+from web3.exceptions import TimeExhausted, TransactionNotFound
 from dotenv import load_dotenv
+from services.prover import encode_proof
+from services.resilience import never_connected
 
 load_dotenv()
 
@@ -10,73 +16,133 @@ RPC_URL = os.getenv("POLYGON_RPC_URL", "https://rpc-amoy.polygon.technology/")
 PRIVATE_KEY = os.getenv("PRIVATE_KEY") # The wallet paying for gas
 CONTRACT_ADDRESS = os.getenv("CONTRACT_ADDRESS")
 
-# ABI - We only need the verifyCreditScore function
-MINIMAL_ABI = [
-    {
-        "inputs": [
-            {"internalType": "uint256[2]", "name": "a", "type": "uint256[2]"},
-            {"internalType": "uint256[2][2]", "name": "b", "type": "uint256[2][2]"},
-            {"internalType": "uint256[2]", "name": "c", "type": "uint256[2]"},
-            {"internalType": "uint256[2]", "name": "input", "type": "uint256[2]"}
-        ],
-        "name": "verifyCreditScore",
-        "outputs": [],
-        "stateMutability": "nonpayable",
-        "type": "function"
-    }
-]
-
-def submit_proof_on_chain(proof_data: dict, public_signals: list):
+# Sentinel.verifyCreditScore reverts unless input[0] >= 700 and input[1] == msg.sender.
+# The gas key sends the transaction, so only proofs issued for the gas key's own
+# address can land; anything else is refused here instead of burning gas on a revert.
+CONTRACT_MIN_THRESHOLD = int(os.getenv("CONTRACT_MIN_THRESHOLD", "700"))
+
+RPC_REQUEST_TIMEOUT = float(os.getenv("POLYGON_RPC_TIMEOUT", "10"))
+
+# Concurrent notary slots share one gas key; serialize nonce allocation + broadcast
+_nonce_lock = threading.Lock()
+
+
+def _contract_precheck(public_signals: list, sender: str):
+    """Returns why the contract would revert, or None."""
+    if len(public_signals) < 2:
+        return "Proof has no threshold / address public signals"
+    if int(public_signals[0]) < CONTRACT_MIN_THRESHOLD:
+        return f"Proof threshold {public_signals[0]} is below the contract minimum {CONTRACT_MIN_THRESHOLD}"
+    if int(public_signals[1]) != int(sender, 16):
+        return "Proof wallet is not the submitting account; the contract requires msg.sender to match"
+    return None
+
+
+def get_transaction_state(tx_hash: str) -> str:
+    """'landed' (mined, succeeded), 'dropped' (can no longer succeed) or 'pending' (may still land)."""
+    w3 = Web3(Web3.HTTPProvider(RPC_URL, request_kwargs={"timeout": RPC_REQUEST_TIMEOUT}))
+    try:
+        receipt = w3.eth.get_transaction_receipt(tx_hash)
+        return "landed" if receipt["status"] == 1 else "dropped"
+    except TransactionNotFound:
+        pass
+    try:
+        w3.eth.get_transaction(tx_hash)
+        return "pending" # Still in the mempool
+    except TransactionNotFound:
+        return "dropped"
+
+def submit_proof_on_chain(
+    proof_data: dict,
+    public_signals: list,
+    encoded: dict = None,
+    timeout: float = 120,
+    on_signed: Callable[[str], None] = None
+):
     """
     Acts as the 'Notary'. Submits the ZK Proof to Polygon.
+    `encoded` is the prover's compact encoding; its calldata is sent as-is.
+    Returns within `timeout` seconds: every RPC request and the receipt wait share it.
+    `on_signed(tx_hash)` runs before the transaction is broadcast; if it raises, nothing is sent.
     """
+    deadline = time.monotonic() + timeout
     if not PRIVATE_KEY or not CONTRACT_ADDRESS:
-        return {"status": "error", "message": "Blockchain credentials missing"}
+        return {"status": "error", "message": "Blockchain credentials missing", "sent": False}
 
+    sent = False
     try:
-        w3 = Web3(Web3.HTTPProvider(RPC_URL))
+        w3 = Web3(Web3.HTTPProvider(
+            RPC_URL, request_kwargs={"timeout": min(RPC_REQUEST_TIMEOUT, timeout)}
+        ))
         if not w3.is_connected():
-            return {"status": "error", "message": "Could not connect to Polygon"}
+            return {"status": "error", "message": "Could not connect to Polygon", "sent": False}
 
         account = w3.eth.account.from_key(PRIVATE_KEY)
 
+        revert_reason = _contract_precheck(public_signals, account.address)
+        if revert_reason:
+            return {"status": "error", "message": revert_reason, "sent": False}
+
         # FIX 1: Convert string address to Checksum Address
         # Pylance requires this specific format to accept it as an address
         checksum_address = w3.to_checksum_address(CONTRACT_ADDRESS)
 
-        contract = w3.eth.contract(address=checksum_address, abi=MINIMAL_ABI)
-
-        # 1. Format Proof for Solidity
-        p_a = [int(x) for x in proof_data["pi_a"][0:2]]
-        p_b = [[int(x) for x in row] for row in proof_data["pi_b"][0:2]]
-        p_c = [int(x) for x in proof_data["pi_c"][0:2]]
-        p_input = [int(x) for x in public_signals]
-
-        # 2. Build Transaction
-        tx = contract.functions.verifyCreditScore(
-            p_a, p_b, p_c, p_input
-        ).build_transaction({
-            'from': account.address,
-            'nonce': w3.eth.get_transaction_count(account.address),
-            'gas': 500000,
-            'gasPrice': w3.eth.gas_price
-        })
-
-        # 3. Sign & Send
-        signed_tx = w3.eth.account.sign_transaction(tx, PRIVATE_KEY)
-        tx_hash = w3.eth.send_raw_transaction(signed_tx.rawTransaction)
-        
-        # 4. Wait for Receipt
-        receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
+        # 1. verifyCreditScore calldata, precomputed by the prover
+        if encoded is None:
+            encoded = encode_proof(proof_data, public_signals)
+
+        # 2. Build, Sign & Send
+        # "pending" counts our own unmined transactions, so back-to-back submissions
+        # get consecutive nonces instead of replacing each other
+        with _nonce_lock:
+            tx = {
+                'to': checksum_address,
+                'data': encoded["calldata"],
+                'from': account.address,
+                'nonce': w3.eth.get_transaction_count(account.address, "pending"),
+                'gas': 500000,
+                'gasPrice': w3.eth.gas_price,
+                'chainId': w3.eth.chain_id
+            }
+            signed_tx = w3.eth.account.sign_transaction(tx, PRIVATE_KEY)
+            tx_hash_hex = "0x" + bytes(signed_tx.hash).hex()
+            if on_signed:
+                on_signed(tx_hash_hex)
+            # From here on a failure may still have reached the mempool
+            sent = True
+            tx_hash = w3.eth.send_raw_transaction(signed_tx.rawTransaction)
+
+        # 3. Wait for Receipt
+        try:
+            receipt = w3.eth.wait_for_transaction_receipt(
+                tx_hash, timeout=max(deadline - time.monotonic(), 0.1)
+            )
+        except TimeExhausted:
+            # The transaction may still land; it is reported, not retried
+            return {
+                "status": "timeout",
+                "message": f"No confirmation within {timeout}s",
+                "tx_hash": tx_hash_hex,
+                "sent": True
+            }
 
         # FIX 2: Use bracket notation for TypedDict access
         # receipt is an AttributeDict, but Pylance treats it strictly as a Dict
+        if receipt["status"] == 0:
+            return {
+                "status": "error",
+                "message": "Transaction reverted",
+                "tx_hash": tx_hash_hex,
+                "block_number": receipt["blockNumber"],
+                "sent": True
+            }
         return {
             "status": "success", 
-            "tx_hash": tx_hash.hex(),
+            "tx_hash": tx_hash_hex,
             "block_number": receipt["blockNumber"] 
         }
 
     except Exception as e:
         print(f"Blockchain Error: {e}")
-        return {"status": "error", "message": str(e)}
\ No newline at end of file
+        # A connection that was never established cannot have broadcast anything
+        return {"status": "error", "message": str(e), "sent": sent and not never_connected(e)}
\ No newline at end of file
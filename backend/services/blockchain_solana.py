@@ -1,11 +1,18 @@
 import os
 import json
+import time
+import threading
+from typing import Callable
+
+import httpx
 from dotenv import load_dotenv
+from services.prover import encode_proof
 
 # Modern Solana imports (solders)
 from solana.rpc.api import Client
 from solders.keypair import Keypair
 from solders.pubkey import Pubkey
+from solders.signature import Signature
 from solders.instruction import Instruction
 from solders.message import Message
 from solders.transaction import Transaction
@@ -16,8 +23,49 @@ load_dotenv()
 SOLANA_RPC_URL = os.getenv("SOLANA_RPC_URL", "https://api.devnet.solana.com")
 PRIVATE_KEY_BYTES = os.getenv("SOLANA_PRIVATE_KEY") 
 
-def get_solana_client():
-    return Client(SOLANA_RPC_URL)
+# A blockhash stays valid for ~150 slots (~60s); reuse a recent one instead of
+# fetching it on the critical path of every submission.
+BLOCKHASH_MAX_AGE = float(os.getenv("SOLANA_BLOCKHASH_MAX_AGE", "20"))
+_blockhash_cache = {"value": None, "fetched_at": 0.0}
+_blockhash_lock = threading.Lock()
+
+def get_solana_client(timeout: float = 10):
+    return Client(SOLANA_RPC_URL, timeout=timeout)
+
+def get_recent_blockhash(client=None):
+    """Cached latest blockhash; refreshed once older than BLOCKHASH_MAX_AGE seconds."""
+    with _blockhash_lock:
+        if _blockhash_cache["value"] and time.monotonic() - _blockhash_cache["fetched_at"] < BLOCKHASH_MAX_AGE:
+            return _blockhash_cache["value"]
+    value = (client or get_solana_client()).get_latest_blockhash().value.blockhash
+    with _blockhash_lock:
+        _blockhash_cache["value"] = value
+        _blockhash_cache["fetched_at"] = time.monotonic()
+    return value
+
+def prefetch_blockhash():
+    """Warms the blockhash cache ahead of the notary stage."""
+    return str(get_recent_blockhash())
+
+def get_signature_state(signature: str) -> str:
+    """
+    'landed' (succeeded), 'dropped' (failed, or unknown long after its blockhash
+    expired) or 'pending'. Only call it once the blockhash has surely expired.
+    """
+    status = get_solana_client().get_signature_statuses(
+        [Signature.from_string(signature)], search_transaction_history=True
+    ).value[0]
+    if status is None or status.err is not None:
+        return "dropped"
+    return "landed"
+
+def _never_connected(exc: Exception) -> bool:
+    """solana-py wraps httpx errors; a failed connect means nothing was sent."""
+    while exc is not None:
+        if isinstance(exc, (httpx.ConnectError, httpx.ConnectTimeout)):
+            return True
+        exc = exc.__cause__ or exc.__context__
+    return False
 
 def get_payer():
     if not PRIVATE_KEY_BYTES:
@@ -33,24 +81,36 @@ def get_payer():
         print(f"Keypair Error: {e}")
         return None
 
-def submit_proof_on_solana(proof_data: dict, public_signals: list):
+def submit_proof_on_solana(
+    proof_data: dict,
+    public_signals: list,
+    encoded: dict = None,
+    timeout: float = 10,
+    on_signed: Callable[[str], None] = None
+):
     """
     Acts as the Solana Notary. 
     Records the Credit Score and Proof Hash as a Memo on the Solana Blockchain.
+    `encoded` is the prover's compact encoding; its proof_hash is anchored as-is.
+    `timeout` bounds each RPC request (blockhash fetch + send).
+    `on_signed(signature)` runs before the transaction is sent; if it raises, nothing is sent.
     """
-    client = get_solana_client()
+    client = get_solana_client(timeout)
     payer = get_payer()
 
     if not payer:
-        return {"status": "error", "message": "Solana Wallet credentials missing"}
+        return {"status": "error", "message": "Solana Wallet credentials missing", "sent": False}
 
+    sent = False
     try:
         # 1. Prepare Data for On-Chain Record
         # signals[0] is usually the Score/Threshold
         score = public_signals[0] if len(public_signals) > 0 else "0"
         
-        # Create a short hash of the proof to anchor it
-        proof_hash = str(hash(json.dumps(proof_data)))[:16]
+        # Anchor the prover's stable keccak hash of the packed proof
+        if encoded is None:
+            encoded = encode_proof(proof_data, public_signals)
+        proof_hash = encoded["proof_hash"]
         
         memo_data = json.dumps({
             "project": "ZK-Sentinel",
@@ -74,16 +134,20 @@ def submit_proof_on_solana(proof_data: dict, public_signals: list):
 
         # 3. Build & Sign Transaction
         # Fetch latest blockhash to ensure transaction validity
-        recent_blockhash = client.get_latest_blockhash().value.blockhash
+        recent_blockhash = get_recent_blockhash(client)
         
         # Create a Message containing the instruction
         msg = Message([memo_ix], payer.pubkey())
         
         # Create Transaction object (this automatically signs it with the provided keypair)
         tx = Transaction([payer], msg, recent_blockhash)
+        if on_signed:
+            on_signed(str(tx.signatures[0]))
         
         # 4. Send Transaction
         # FIX: We only pass the transaction object. 'opts' is optional and defaults to None.
+        # From here on a failure may still have reached the cluster
+        sent = True
         response = client.send_transaction(tx)
         
         signature = response.value
@@ -97,4 +161,4 @@ def submit_proof_on_solana(proof_data: dict, public_signals: list):
 
     except Exception as e:
         print(f"Solana Notary Error: {e}")
-        return {"status": "error", "message": str(e)}
\ No newline at end of file
+        return {"status": "error", "message": str(e), "sent": sent and not _never_connected(e)}
\ No newline at end of file
@@ -0,0 +1,253 @@
+import os
+import time
+import hashlib
+import asyncio
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from sqlalchemy.exc import IntegrityError
+from dotenv import load_dotenv
+
+from database import SessionLocal, NotarySubmission, VerificationEvent
+
+load_dotenv()
+
+# Configuration
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "600"))
+MAX_KEY_LENGTH = int(os.getenv("IDEMPOTENCY_KEY_MAX_LENGTH", "255"))
+# A claim still pending (or failed after broadcast) this long is resolved from the
+# chain. Must exceed the slowest notary timeout and Solana's blockhash lifetime.
+STALE_PENDING_AFTER = float(os.getenv("NOTARY_STALE_PENDING_SECONDS", "900"))
+
+
+class IdempotencyKeyMismatch(Exception):
+    """An Idempotency-Key was reused for a different wallet or document."""
+
+    def __init__(self, key: str):
+        super().__init__(f"Idempotency-Key '{key[:12]}...' was already used for a different request")
+        self.key = key
+
+
+def default_idempotency_key(wallet_address: str, document_digest: str) -> str:
+    """
+    Used when the client sends no Idempotency-Key: same wallet + same document = same run.
+    Also the request fingerprint stored next to client-supplied keys.
+    """
+    material = f"{wallet_address.lower().strip()}:{document_digest}"
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls with the same key onto one in-flight task and
+    replays successful results for IDEMPOTENCY_TTL seconds. Failures are not cached.
+    A key reused with a different fingerprint raises IdempotencyKeyMismatch.
+
+    The shared task is shielded, so a disconnecting leader does not cancel the
+    run that other callers are waiting on.
+    """
+
+    def __init__(self, ttl: float = IDEMPOTENCY_TTL):
+        self.ttl = ttl
+        self._inflight: Dict[str, Tuple[Optional[str], asyncio.Task]] = {}
+        self._done: Dict[str, Tuple[float, Optional[str], Any]] = {}
+
+    def _evict(self):
+        now = time.monotonic()
+        for key in [k for k, (expires, _, _) in self._done.items() if expires <= now]:
+            del self._done[key]
+
+    def _settle(self, key: str, fingerprint: Optional[str], task: asyncio.Task):
+        self._inflight.pop(key, None)
+        if not task.cancelled() and task.exception() is None and self.ttl > 0:
+            self._done[key] = (time.monotonic() + self.ttl, fingerprint, task.result())
+
+    @staticmethod
+    def _check(key: str, expected: Optional[str], fingerprint: Optional[str]):
+        if expected is not None and fingerprint is not None and expected != fingerprint:
+            raise IdempotencyKeyMismatch(key)
+
+    async def run(
+        self, key: str, factory: Callable[[], Awaitable[Any]], fingerprint: Optional[str] = None
+    ) -> Tuple[Any, str]:
+        """Returns (result, outcome) where outcome is 'leader', 'joined' or 'cached'."""
+        self._evict()
+        if key in self._done:
+            _, expected, result = self._done[key]
+            self._check(key, expected, fingerprint)
+            return result, "cached"
+
+        if key in self._inflight:
+            expected, task = self._inflight[key]
+            self._check(key, expected, fingerprint)
+            return await asyncio.shield(task), "joined"
+
+        task = asyncio.create_task(factory())
+        self._inflight[key] = (fingerprint, task)
+        task.add_done_callback(lambda t: self._settle(key, fingerprint, t))
+        return await asyncio.shield(task), "leader"
+
+
+# --- Notary ledger (durable, survives restarts and the TTL window) ---
+# pending: claimed | success: done (or timed out unconfirmed) | error: failed before
+# anything was broadcast, key released | failed: failed after a broadcast, key held
+# until its recorded transactions are known to have been dropped
+
+# Chains of one submission record their transactions concurrently
+_transactions_lock = threading.Lock()
+
+def _sent_nothing(result: dict) -> bool:
+    """True only if every chain reports it failed before broadcasting (sent=False)."""
+    chains = result.get("chains")
+    return bool(chains) and all(r.get("status") == "error" and r.get("sent") is False for r in chains.values())
+
+
+def _landed_since(db, wallet: Optional[str], since: datetime) -> Optional[VerificationEvent]:
+    """A verification for `wallet` recorded by the indexer after `since`, if any."""
+    if not wallet:
+        return None
+    return (
+        db.query(VerificationEvent)
+        .filter(
+            VerificationEvent.wallet == wallet.lower(),
+            VerificationEvent.timestamp >= int(since.replace(tzinfo=timezone.utc).timestamp()),
+        )
+        .order_by(VerificationEvent.timestamp.desc())
+        .first()
+    )
+
+
+def _reclaim(db, row: NotarySubmission, status: str) -> bool:
+    """Atomically flips a row still in `status` (same claim time) back to a fresh pending claim."""
+    updated = (
+        db.query(NotarySubmission)
+        .filter(
+            NotarySubmission.idempotency_key == row.idempotency_key,
+            NotarySubmission.status == status,
+            NotarySubmission.created_at == row.created_at,
+        )
+        .update(
+            {"status": "pending", "result": None, "transactions": None, "created_at": datetime.utcnow()},
+            synchronize_session=False,
+        )
+    )
+    db.commit()
+    return updated == 1
+
+
+def _resolve_stale(
+    db, row: NotarySubmission, wallet: Optional[str], transaction_state: Optional[Callable[[str, str], str]]
+) -> Tuple[str, Optional[dict]]:
+    """
+    Decides a stale claim from the chain: ('landed', result), ('dropped', None) when
+    nothing sent for it can still land, or ('pending', None) when something might.
+    """
+    transactions = row.transactions or {}
+    states = {}
+    for chain, tx_hash in transactions.items():
+        try:
+            states[chain] = transaction_state(chain, tx_hash) if transaction_state else "pending"
+        except Exception as e:
+            print(f"⚠️ Notary: could not check {chain} transaction {tx_hash}: {e}")
+            states[chain] = "pending"
+        if states[chain] == "landed":
+            return "landed", {"status": "success", "chain": chain, "tx_hash": tx_hash, "recovered": True}
+
+    event = _landed_since(db, wallet, row.created_at)
+    if event is not None:
+        return "landed", {
+            "status": "success",
+            "chain": event.chain,
+            "tx_hash": event.tx_hash,
+            "block_number": event.block_number,
+            "recovered": True,
+        }
+    if any(state == "pending" for state in states.values()):
+        return "pending", None
+    return "dropped", None
+
+
+def claim_notarization(
+    key: str,
+    fingerprint: Optional[str] = None,
+    wallet: Optional[str] = None,
+    transaction_state: Optional[Callable[[str, str], str]] = None,
+) -> Optional[dict]:
+    """
+    Reserves `key` for an on-chain submission.
+    Returns None if the caller may submit, otherwise the earlier submission's state.
+    The key is released again by an error known to precede any broadcast, or, once
+    a pending / failed claim is STALE_PENDING_AFTER old, when none of its recorded
+    transactions landed or can still land (`transaction_state(chain, tx_hash)` returns
+    'landed', 'dropped' or 'pending') and the indexer has seen nothing for `wallet`.
+    Raises IdempotencyKeyMismatch if the key was claimed for another fingerprint.
+    """
+    in_progress = {"status": "pending", "message": "Submission already in progress"}
+    db = SessionLocal()
+    try:
+        existing = db.get(NotarySubmission, key)
+        if existing is not None:
+            SingleFlight._check(key, existing.fingerprint, fingerprint)
+            if existing.status == "error":
+                return None if _reclaim(db, existing, "error") else in_progress
+
+            stale = datetime.utcnow() - existing.created_at > timedelta(seconds=STALE_PENDING_AFTER)
+            if existing.status in ("pending", "failed") and stale:
+                outcome, recovered = _resolve_stale(db, existing, wallet, transaction_state)
+                if outcome == "dropped":
+                    print(f"♻️ Notary: re-claiming stale {existing.status} submission {key[:12]}")
+                    return None if _reclaim(db, existing, existing.status) else in_progress
+                if outcome == "landed":
+                    # The earlier transaction landed; record it instead of resubmitting
+                    existing.status = "success"
+                    existing.result = recovered
+                    db.commit()
+
+            return existing.result or in_progress
+
+        db.add(NotarySubmission(idempotency_key=key, fingerprint=fingerprint, status="pending"))
+        try:
+            db.commit()
+        except IntegrityError:
+            # Another worker claimed it between our read and insert
+            db.rollback()
+            return in_progress
+        return None
+    finally:
+        db.close()
+
+
+def record_notary_transaction(key: str, chain: str, tx_hash: str):
+    """Stores a signed transaction's hash on the claim before it is sent (see submitters' on_signed)."""
+    with _transactions_lock:
+        db = SessionLocal()
+        try:
+            row = db.get(NotarySubmission, key)
+            if row is None:
+                return
+            # Reassign: in-place changes to a JSON column are not tracked
+            row.transactions = {**(row.transactions or {}), chain: tx_hash}
+            db.commit()
+        finally:
+            db.close()
+
+
+def complete_notarization(key: str, result: dict):
+    db = SessionLocal()
+    try:
+        row = db.get(NotarySubmission, key)
+        if row is None:
+            return
+        if result.get("status") != "error":
+            row.status = "success"
+        else:
+            # A failure after broadcast may still land on-chain: never resubmit it
+            row.status = "error" if _sent_nothing(result) else "failed"
+        row.result = result
+        db.commit()
+    finally:
+        db.close()
+
+
+pipeline_flight = SingleFlight()
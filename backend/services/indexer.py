@@ -0,0 +1,277 @@
+import os
+import time
+import asyncio
+import threading
+from typing import Dict, List, Optional
+
+from web3 import Web3
+from dotenv import load_dotenv
+
+from database import SessionLocal, VerificationEvent, IndexerCursor, init_db
+
+load_dotenv()
+
+# Configuration
+# Point INDEXER_RPC_URL at a local Hardhat node (http://127.0.0.1:8545) with
+# INDEXER_CONFIRMATIONS=0 to test end-to-end (Hardhat only mines on demand).
+INDEXER_RPC_URL = os.getenv("INDEXER_RPC_URL", os.getenv("POLYGON_RPC_URL", "https://rpc-amoy.polygon.technology/"))
+CONTRACT_ADDRESS = os.getenv("CONTRACT_ADDRESS")
+START_BLOCK = int(os.getenv("INDEXER_START_BLOCK", "0"))
+CONFIRMATION_DEPTH = int(os.getenv("INDEXER_CONFIRMATIONS", "12"))
+POLL_INTERVAL = float(os.getenv("INDEXER_POLL_INTERVAL", "5"))
+MAX_BLOCK_RANGE = int(os.getenv("INDEXER_MAX_BLOCK_RANGE", "2000"))
+SOLANA_DROP_AFTER = int(os.getenv("INDEXER_SOLANA_DROP_AFTER", "180")) # Blockhash expiry + margin
+
+# ABI - We only need the CreditVerified event
+EVENT_ABI = [
+    {
+        "anonymous": False,
+        "inputs": [
+            {"indexed": True, "internalType": "address", "name": "user", "type": "address"},
+            {"indexed": False, "internalType": "uint256", "name": "timestamp", "type": "uint256"},
+            {"indexed": False, "internalType": "uint256", "name": "scoreThreshold", "type": "uint256"}
+        ],
+        "name": "CreditVerified",
+        "type": "event"
+    }
+]
+CREDIT_VERIFIED_TOPIC = "0x" + bytes(Web3.keccak(text="CreditVerified(address,uint256,uint256)")).hex()
+
+
+def decimal_to_address(addr_decimal) -> str:
+    """Inverse of prover.address_to_decimal: public signal -> lowercase 0x address."""
+    return "0x" + format(int(addr_decimal), "040x")
+
+
+def _as_dict(row: VerificationEvent) -> dict:
+    return {
+        "verified": True,
+        "confirmed": row.confirmed,
+        "chain": row.chain,
+        "tx_hash": row.tx_hash,
+        "block_number": row.block_number,
+        "timestamp": row.timestamp,
+        "score_threshold": row.score_threshold,
+    }
+
+
+class VerificationIndex:
+    """
+    Follows CreditVerified logs and our Solana memo submissions into SQLite,
+    and keeps the best record per wallet in memory so lookups never touch disk or RPC.
+
+    Reorgs: everything above the cursor (head - CONFIRMATION_DEPTH) is treated as
+    provisional and re-fetched on every poll, replacing what was stored before.
+    """
+
+    def __init__(self):
+        self._by_wallet: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._w3: Optional[Web3] = None
+        self._contract = None
+
+    # --- Serving ---
+    def lookup(self, wallets: List[str]) -> Dict[str, dict]:
+        empty = {"verified": False, "confirmed": False}
+        index = self._by_wallet
+        return {w: index.get(w.lower().strip(), empty) for w in wallets}
+
+    def load(self):
+        init_db()
+        db = SessionLocal()
+        try:
+            wallets = [w for (w,) in db.query(VerificationEvent.wallet).distinct()]
+        finally:
+            db.close()
+        self._refresh(wallets)
+        print(f"📇 Indexer: loaded {len(self._by_wallet)} verified wallets")
+
+    def _refresh(self, wallets):
+        """Recompute the served record for each wallet: confirmed beats pending, newest wins."""
+        if not wallets:
+            return
+        db = SessionLocal()
+        try:
+            rows = (
+                db.query(VerificationEvent)
+                .filter(VerificationEvent.wallet.in_(list(wallets)))
+                .all()
+            )
+        finally:
+            db.close()
+
+        best: Dict[str, VerificationEvent] = {}
+        for row in rows:
+            current = best.get(row.wallet)
+            if current is None or (row.confirmed, row.timestamp) > (current.confirmed, current.timestamp):
+                best[row.wallet] = row
+
+        with self._lock:
+            index = dict(self._by_wallet)
+            for wallet in wallets:
+                if wallet in best:
+                    index[wallet] = _as_dict(best[wallet])
+                else:
+                    index.pop(wallet, None)
+            # Swap, so readers never see a half-updated dict
+            self._by_wallet = index
+
+    # --- EVM (CreditVerified) ---
+    def _evm(self):
+        if self._w3 is None:
+            self._w3 = Web3(Web3.HTTPProvider(INDEXER_RPC_URL))
+            address = self._w3.to_checksum_address(CONTRACT_ADDRESS)
+            self._contract = self._w3.eth.contract(address=address, abi=EVENT_ABI)
+        return self._w3, self._contract
+
+    def _fetch_logs(self, start: int, end: int) -> list:
+        w3, contract = self._evm()
+        logs = []
+        while start <= end:
+            stop = min(end, start + MAX_BLOCK_RANGE - 1)
+            logs += w3.eth.get_logs({
+                "address": contract.address,
+                "fromBlock": start,
+                "toBlock": stop,
+                "topics": [CREDIT_VERIFIED_TOPIC],
+            })
+            start = stop + 1
+        return logs
+
+    def _replace_range(self, db, start: int, end: Optional[int], logs: list, confirmed: bool) -> set:
+        """Replaces the stored evm events in [start, end] (end=None: open-ended) with `logs`."""
+        _, contract = self._evm()
+        stale = db.query(VerificationEvent).filter(
+            VerificationEvent.chain == "evm",
+            VerificationEvent.block_number >= start
+        )
+        if end is not None:
+            stale = stale.filter(VerificationEvent.block_number <= end)
+        touched = {row.wallet for row in stale}
+        stale.delete(synchronize_session=False)
+
+        for log in logs:
+            event = contract.events.CreditVerified().process_log(log)
+            wallet = event["args"]["user"].lower()
+            touched.add(wallet)
+            db.add(VerificationEvent(
+                chain="evm",
+                wallet=wallet,
+                tx_hash="0x" + bytes(event["transactionHash"]).hex(),
+                log_index=event["logIndex"],
+                block_number=event["blockNumber"],
+                timestamp=event["args"]["timestamp"],
+                score_threshold=event["args"]["scoreThreshold"],
+                confirmed=confirmed,
+            ))
+        return touched
+
+    def sync_evm_once(self):
+        w3, _ = self._evm()
+        head = w3.eth.block_number
+        safe = head - CONFIRMATION_DEPTH
+
+        db = SessionLocal()
+        try:
+            cursor = db.get(IndexerCursor, "evm")
+            if cursor is None:
+                cursor = IndexerCursor(chain="evm", block_number=START_BLOCK - 1)
+                db.add(cursor)
+
+            # Confirmed range: one commit per chunk, so a long backfill keeps its
+            # progress and never holds more than MAX_BLOCK_RANGE blocks of logs
+            while cursor.block_number < safe:
+                start = cursor.block_number + 1
+                end = min(safe, start + MAX_BLOCK_RANGE - 1)
+                touched = self._replace_range(db, start, end, self._fetch_logs(start, end), confirmed=True)
+                cursor.block_number = end
+                db.commit()
+                self._refresh(touched)
+
+            # Provisional window; it is replaced by what the canonical chain says now
+            start = cursor.block_number + 1
+            touched = self._replace_range(db, start, None, self._fetch_logs(start, head), confirmed=False)
+            db.commit()
+        finally:
+            db.close()
+
+        self._refresh(touched)
+
+    # --- Solana (memo submissions) ---
+    def record_solana_submission(self, wallet: str, tx_hash: str, score_threshold: int):
+        """Called by the notary right after a memo is sent. Pending until finalized."""
+        wallet = wallet.lower()
+        db = SessionLocal()
+        try:
+            db.add(VerificationEvent(
+                chain="solana",
+                wallet=wallet,
+                tx_hash=tx_hash,
+                log_index=0,
+                timestamp=int(time.time()),
+                score_threshold=int(score_threshold),
+                confirmed=False,
+            ))
+            db.commit()
+        finally:
+            db.close()
+        self._refresh([wallet])
+
+    def sync_solana_once(self):
+        from solders.signature import Signature
+        from services.blockchain_solana import get_solana_client
+
+        db = SessionLocal()
+        try:
+            pending = db.query(VerificationEvent).filter(
+                VerificationEvent.chain == "solana",
+                VerificationEvent.confirmed == False  # noqa: E712
+            ).all()
+            if not pending:
+                return
+
+            # get_signature_statuses accepts up to 256 signatures per call
+            touched = set()
+            for i in range(0, len(pending), 256):
+                batch = pending[i:i + 256]
+                statuses = get_solana_client().get_signature_statuses(
+                    [Signature.from_string(row.tx_hash) for row in batch]
+                ).value
+                for row, status in zip(batch, statuses):
+                    if status is None:
+                        # Never landed: blockhash expired, drop it
+                        if time.time() - row.timestamp > SOLANA_DROP_AFTER:
+                            db.delete(row)
+                            touched.add(row.wallet)
+                        continue
+                    if status.err is not None:
+                        db.delete(row)
+                        touched.add(row.wallet)
+                        continue
+                    row.block_number = status.slot
+                    if "finalized" in str(status.confirmation_status).lower():
+                        row.confirmed = True
+                    touched.add(row.wallet)
+            db.commit()
+        finally:
+            db.close()
+
+        self._refresh(touched)
+
+    # --- Background loop ---
+    async def run(self):
+        await asyncio.to_thread(self.load)
+        while True:
+            if CONTRACT_ADDRESS:
+                try:
+                    await asyncio.to_thread(self.sync_evm_once)
+                except Exception as e:
+                    print(f"⚠️ Indexer EVM sync error: {e}")
+            try:
+                await asyncio.to_thread(self.sync_solana_once)
+            except Exception as e:
+                print(f"⚠️ Indexer Solana sync error: {e}")
+            await asyncio.sleep(POLL_INTERVAL)
+
+
+verification_index = VerificationIndex()
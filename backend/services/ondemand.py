@@ -2,6 +2,8 @@ import os
 import requests
 import json
 import logging
+from services.resilience import upstream
+from services.statement_parser import is_structured_statement, parse_statement
 
 # Load Key
 ONDEMAND_API_KEY = os.getenv("ONDEMAND_API_KEY")
@@ -10,6 +12,10 @@ BASE_URL = "https://api.on-demand.io/chat/v1"
 
 logger = logging.getLogger(__name__)
 
+# Resilience: breakers trip on error rate or latency and send callers straight to fallbacks
+chat_upstream = upstream("ondemand_chat")
+media_upstream = upstream("ondemand_media")
+
 # Standard headers for JSON commands
 json_headers = {
     "apikey": ONDEMAND_API_KEY,
@@ -32,18 +38,21 @@ def create_chat_session(external_user_id: str = "user_default"):
         "externalUserId": external_user_id
     } 
     
-    try:
+    def _create(timeout):
         # Increased timeout for stability
-        res = requests.post(url, headers=json_headers, json=body, timeout=15)
-        
-        if res.status_code in [200, 201]:
-            # Success: { "data": { "id": "..." } }
-            val = res.json().get("data", {}).get("id")
-            print(f"✅ OnDemand Session Created: {val}")
-            return val
-        else:
-            print(f"⚠️ Session Create Failed ({res.status_code}): {res.text}")
-            return "mock-session-id" 
+        res = requests.post(url, headers=json_headers, json=body, timeout=timeout)
+        res.raise_for_status()
+        return res
+
+    try:
+        res = chat_upstream.call(_create, deadline=15)
+        # Success: { "data": { "id": "..." } }
+        val = res.json().get("data", {}).get("id")
+        print(f"✅ OnDemand Session Created: {val}")
+        return val
+    except requests.HTTPError as e:
+        print(f"⚠️ Session Create Failed ({e.response.status_code}): {e.response.text}")
+        return "mock-session-id" 
     except Exception as e:
         print(f"❌ Connection Error (Session): {e}")
         return "mock-session-id"
@@ -65,9 +74,13 @@ def send_chat_message(session_id: str, message: str, agent_id: str):
         "responseMode": "sync"
     }
     
-    try:
-        res = requests.post(url, headers=json_headers, json=payload, timeout=30)
+    def _query(timeout):
+        res = requests.post(url, headers=json_headers, json=payload, timeout=timeout)
         res.raise_for_status()
+        return res
+
+    try:
+        res = chat_upstream.call(_query, deadline=30)
         
         # Parse response (structure varies by API version, handling both common patterns)
         data = res.json().get("data", {})
@@ -79,9 +92,18 @@ def send_chat_message(session_id: str, message: str, agent_id: str):
 
 def analyze_document(agent_id: str, file_path: str):
     """
-    Agent 2 (Vision): Uploads file to Media API.
+    Agent 2 (Vision): Totals structured statements (CSV/OFX/JSON) locally,
+    uploads everything else to the Media API.
     """
     print(f"🔍 Agent 2 (Auditor) analyzing: {file_path}")
+
+    if is_structured_statement(file_path):
+        try:
+            result = parse_statement(file_path)
+            print(f"✅ Parsed {result['transactions']} transactions locally")
+            return result
+        except Exception as e:
+            print(f"⚠️ Local parse failed ({e}). Falling back to remote Auditor.")
     
     if ONDEMAND_API_KEY and agent_id != "agent-mock":
         try:
@@ -91,12 +113,17 @@ def analyze_document(agent_id: str, file_path: str):
             # Headers for upload (Do NOT set Content-Type, requests does it)
             auth_headers = {"apikey": ONDEMAND_API_KEY}
 
-            with open(file_path, "rb") as f:
-                # 'file' is the standard key for multipart forms
-                files = {'file': (os.path.basename(file_path), f, 'application/octet-stream')}
-                
-                response = requests.post(upload_url, headers=auth_headers, files=files, timeout=45)
-            
+            def _upload(timeout):
+                # Re-open on every attempt so retries resend the whole file
+                with open(file_path, "rb") as f:
+                    # 'file' is the standard key for multipart forms
+                    files = {'file': (os.path.basename(file_path), f, 'application/octet-stream')}
+                    
+                    res = requests.post(upload_url, headers=auth_headers, files=files, timeout=timeout)
+                res.raise_for_status()
+                return res
+
+            response = media_upstream.call(_upload, deadline=45)
             if response.status_code in [200, 201]:
                 data = response.json()
                 print(f"✅ Document Upload Success. ID: {data.get('id')}")
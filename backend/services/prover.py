@@ -4,6 +4,7 @@ import os
 import uuid
 import logging
 from typing import Dict, Any, Optional
+from web3 import Web3
 
 # Configure Logging
 logging.basicConfig(level=logging.INFO)
@@ -20,6 +21,49 @@ WASM_PATH = os.path.join(CIRCUIT_DIR, "credit_score_js/credit_score.wasm")
 WITNESS_GEN_SCRIPT = os.path.join(CIRCUIT_DIR, "credit_score_js/generate_witness.js")
 ZKEY_PATH = os.path.join(CIRCUIT_DIR, "credit_score_final.zkey")
 
+# verifyCreditScore(uint[2] a, uint[2][2] b, uint[2] c, uint[2] input) - all static, so
+# the calldata is just the selector followed by the 10 packed words.
+VERIFY_SELECTOR = Web3.keccak(text="verifyCreditScore(uint256[2],uint256[2][2],uint256[2],uint256[2])")[:4]
+PROOF_FORMATS = ("compact", "snarkjs", "both")
+
+def _word(value) -> bytes:
+    return int(value).to_bytes(32, "big")
+
+def encode_proof(proof: Dict[str, Any], public_signals: list) -> Dict[str, Any]:
+    """
+    Canonical compact encoding of a snarkjs Groth16 proof.
+    Drops the projective "1" coordinates, swaps pi_b into the Fp2 order the
+    Solidity verifier expects, and packs every element as a 32-byte word.
+    """
+    a = proof["pi_a"][0:2]
+    b = [[proof["pi_b"][0][1], proof["pi_b"][0][0]], [proof["pi_b"][1][1], proof["pi_b"][1][0]]]
+    c = proof["pi_c"][0:2]
+
+    words = [_word(x) for x in a] + [_word(x) for row in b for x in row] + [_word(x) for x in c]
+    words += [_word(x) for x in public_signals]
+    packed = b"".join(words)
+
+    def hexed(values):
+        return ["0x" + _word(x).hex() for x in values]
+
+    return {
+        "a": hexed(a),
+        "b": [hexed(row) for row in b],
+        "c": hexed(c),
+        "inputs": hexed(public_signals),
+        "packed": "0x" + packed.hex(),
+        "calldata": "0x" + (VERIFY_SELECTOR + packed).hex(),
+        "proof_hash": "0x" + bytes(Web3.keccak(packed)).hex(),
+    }
+
+def format_proof_result(proof_result: Dict[str, Any], proof_format: str = "both") -> Dict[str, Any]:
+    """Shapes generate_zk_proof output for API responses."""
+    if proof_result.get("status") != "success" or proof_format == "both":
+        return proof_result
+    if proof_format == "compact":
+        return {k: v for k, v in proof_result.items() if k not in ("proof", "public_signals")}
+    return {k: v for k, v in proof_result.items() if k != "encoded"}
+
 def address_to_decimal(addr_str: str) -> str:
     """
     Converts EVM address (hex) to BN128 Scalar Field compliant decimal.
@@ -32,6 +76,26 @@ def address_to_decimal(addr_str: str) -> str:
     except ValueError:
         raise ValueError("Invalid Wallet Address format")
 
+_warmed = False
+
+def warm_up_prover() -> bool:
+    """
+    Reads the circuit artifacts once so the first proof does not pay for cold
+    disk reads (the OS keeps them in the page cache). Safe to call repeatedly.
+    """
+    global _warmed
+    if _warmed:
+        return True
+    for path in (WASM_PATH, WITNESS_GEN_SCRIPT, ZKEY_PATH):
+        if not os.path.exists(path):
+            logger.warning(f"Prover warm-up: missing {path}")
+            return False
+        with open(path, "rb") as f:
+            while f.read(1 << 20):
+                pass
+    _warmed = True
+    return True
+
 async def run_subprocess(cmd: list, description: str):
     """Async wrapper for subprocess calls."""
     logger.info(f"Starting {description}...")
@@ -57,10 +121,12 @@ async def generate_zk_proof(
     credit_score: int, 
     file_content_str: str, 
     wallet_address: str, 
-    threshold: int = 700
+    threshold: int = 700,
+    address_decimal: Optional[str] = None
 ) -> Dict[str, Any]:
     """
     Generates a ZK-SNARK proof binding the Credit Score to the Wallet Address.
+    `address_decimal` skips the conversion when the caller already parsed the address.
     """
     # 1. Initialize variables to None to prevent 'UnboundLocalError' in finally block
     input_path: Optional[str] = None
@@ -78,7 +144,8 @@ async def generate_zk_proof(
 
         # 3. Format Inputs
         # This converts the address to the decimal format the Circuit expects
-        address_decimal = address_to_decimal(wallet_address)
+        if address_decimal is None:
+            address_decimal = address_to_decimal(wallet_address)
         
         input_data = {
             "creditScore": credit_score,
@@ -119,6 +186,7 @@ async def generate_zk_proof(
             "status": "success",
             "proof": proof_data,
             "public_signals": public_signals,
+            "encoded": encode_proof(proof_data, public_signals),
             "user_address_decimal": address_decimal
         }
 
@@ -0,0 +1,321 @@
+import os
+import time
+import random
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Callable, Optional
+
+import requests
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Shared pool for hedged requests (the second, speculative copy of a slow read)
+_hedge_pool = ThreadPoolExecutor(max_workers=int(os.getenv("HEDGE_POOL_SIZE", "8")), thread_name_prefix="hedge")
+
+
+def _env(upstream: str, key: str, default, cast=float):
+    """Per-upstream override, e.g. ONDEMAND_CHAT_BREAKER_COOLDOWN=60."""
+    raw = os.getenv(f"{upstream.upper()}_{key}")
+    return cast(raw) if raw is not None else default
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose breaker is open."""
+
+    def __init__(self, name: str):
+        super().__init__(f"Circuit open for upstream '{name}'")
+        self.name = name
+
+
+class DeadlineExceeded(Exception):
+    """The call's overall deadline ran out before a retry could be made."""
+
+
+def is_upstream_failure(exc: Exception) -> bool:
+    """Timeouts, connection drops, 429 and 5xx are the upstream's fault. 4xx is ours."""
+    if isinstance(exc, (requests.Timeout, requests.ConnectionError)):
+        return True
+    if isinstance(exc, requests.HTTPError) and exc.response is not None:
+        return exc.response.status_code == 429 or exc.response.status_code >= 500
+    return False
+
+
+def never_connected(exc: Exception) -> bool:
+    """
+    True only if the request provably never reached the upstream. requests raises
+    ConnectionError for refused/unresolvable hosts but also for a connection dropped
+    after the body was sent ('Connection aborted'), so look at the urllib3 cause.
+    """
+    if isinstance(exc, requests.ConnectTimeout):
+        return True
+    if not isinstance(exc, requests.ConnectionError) or isinstance(exc, requests.ReadTimeout):
+        return False
+    reason = exc.args[0] if exc.args else None
+    if isinstance(reason, MaxRetryError):
+        reason = reason.reason
+    return isinstance(reason, NewConnectionError)
+
+
+def is_retryable(exc: Exception, idempotent: bool) -> bool:
+    """
+    Idempotent calls retry any upstream failure. Anything else only retries
+    failures that happened before the request was processed: a read timeout, a
+    dropped connection or a 500 may mean the message / upload / session went through.
+    """
+    if idempotent:
+        return is_upstream_failure(exc)
+    if never_connected(exc):
+        return True
+    if isinstance(exc, requests.HTTPError) and exc.response is not None:
+        return exc.response.status_code in (429, 503)
+    return False
+
+
+class CircuitBreaker:
+    """
+    Rolling-window breaker that trips on error rate OR slow-call rate.
+    closed -> open (after cooldown) -> half_open (one probe) -> closed / open
+    """
+
+    def __init__(
+        self,
+        name: str,
+        window: int = 20,
+        min_calls: int = 5,
+        failure_rate: float = 0.5,
+        slow_call_seconds: float = 10.0,
+        slow_call_rate: float = 0.5,
+        cooldown: float = 30.0,
+    ):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.cooldown = cooldown
+        self._calls = deque(maxlen=window)  # (failed, slow)
+        self._state = "closed"
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == "open" and time.monotonic() - self._opened_at >= self.cooldown:
+                self._state = "half_open"
+            return self._state
+
+    def admit(self) -> Optional[str]:
+        """'closed' or 'probe' if a call may go through, None if it must not."""
+        state = self.state
+        with self._lock:
+            if state == "closed":
+                return "closed"
+            if state == "half_open" and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return "probe"
+            return None
+
+    def allow(self) -> bool:
+        return self.admit() is not None
+
+    def release_probe(self):
+        """Called by the probe's owner when it ends without recording an outcome."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record(self, failed: bool, latency: float):
+        slow = latency >= self.slow_call_seconds
+        with self._lock:
+            if self._state == "half_open":
+                self._probe_in_flight = False
+                if failed or slow:
+                    self._trip()
+                else:
+                    self._state = "closed"
+                    self._calls.clear()
+                return
+
+            self._calls.append((failed, slow))
+            total = len(self._calls)
+            if total < self.min_calls:
+                return
+            failures = sum(1 for f, _ in self._calls if f)
+            slows = sum(1 for _, s in self._calls if s)
+            if failures / total >= self.failure_rate or slows / total >= self.slow_call_rate:
+                self._trip()
+
+    def _trip(self):
+        print(f"⚡ Circuit OPEN for {self.name}")
+        self._state = "open"
+        self._opened_at = time.monotonic()
+        self._calls.clear()
+
+
+class RetryBudget:
+    """
+    Caps retries to a fraction of live traffic so retries cannot amplify an outage.
+    Every request deposits `ratio` tokens; every retry spends one.
+    """
+
+    def __init__(self, ratio: float = 0.2, max_tokens: float = 10.0):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self._tokens = max_tokens
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+
+class LatencyTracker:
+    def __init__(self, size: int = 100):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, latency: float):
+        with self._lock:
+            self._samples.append(latency)
+
+    def percentile(self, p: float, min_samples: int = 10) -> Optional[float]:
+        with self._lock:
+            if len(self._samples) < min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+
+class Upstream:
+    """
+    Resilience wrapper for one remote dependency.
+    `fn(timeout)` must raise on failure (use res.raise_for_status()) and must not
+    wait longer than `timeout`, the time left before the call's deadline.
+    Callers catch the exception (including CircuitOpenError) and run their
+    existing fallback.
+    """
+
+    def __init__(self, name: str, hedge_percentile: Optional[float] = None):
+        self.name = name
+        self.breaker = CircuitBreaker(
+            name,
+            failure_rate=_env(name, "BREAKER_FAILURE_RATE", 0.5),
+            slow_call_seconds=_env(name, "BREAKER_SLOW_SECONDS", 10.0),
+            cooldown=_env(name, "BREAKER_COOLDOWN", 30.0),
+        )
+        self.budget = RetryBudget(ratio=_env(name, "RETRY_RATIO", 0.2))
+        self.max_attempts = _env(name, "MAX_ATTEMPTS", 3, cast=int)
+        self.backoff_base = _env(name, "BACKOFF_BASE", 0.2)
+        self.backoff_cap = _env(name, "BACKOFF_CAP", 2.0)
+        self.hedge_percentile = _env(name, "HEDGE_PERCENTILE", float(hedge_percentile or 0.0)) or None
+        self.latency = LatencyTracker()
+
+    def call(self, fn: Callable[[float], Any], deadline: float, idempotent: bool = False) -> Any:
+        """Runs `fn` with retries, never spending more than `deadline` seconds in total."""
+        admitted = self.breaker.admit()
+        if admitted is None:
+            raise CircuitOpenError(self.name)
+
+        expires = time.monotonic() + deadline
+        self.budget.deposit()
+        attempt = 0
+        try:
+            while True:
+                try:
+                    if idempotent and self.hedge_percentile:
+                        return self._hedged(fn, expires)
+                    return self._timed(fn, expires)
+                except Exception as e:
+                    attempt += 1
+                    # Full jitter backoff
+                    delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+                    if (
+                        not is_retryable(e, idempotent)
+                        or attempt >= self.max_attempts
+                        or time.monotonic() + delay >= expires
+                        or not self.budget.withdraw()
+                        or not self.breaker.allow()
+                    ):
+                        raise
+                    print(f"🔁 {self.name}: retry {attempt} in {delay:.2f}s ({e})")
+                    time.sleep(delay)
+        finally:
+            # A probe that ended without record() (deadline, abandoned hedge) must not
+            # keep the breaker half-open forever
+            if admitted == "probe":
+                self.breaker.release_probe()
+
+    def _deadline_exceeded(self) -> DeadlineExceeded:
+        return DeadlineExceeded(f"Deadline exceeded for upstream '{self.name}'")
+
+    def _timed(self, fn: Callable[[float], Any], expires: float) -> Any:
+        start = time.monotonic()
+        remaining = expires - start
+        if remaining <= 0:
+            raise self._deadline_exceeded()
+        try:
+            result = fn(remaining)
+        except Exception as e:
+            self.breaker.record(failed=is_upstream_failure(e), latency=time.monotonic() - start)
+            raise
+        latency = time.monotonic() - start
+        self.latency.add(latency)
+        self.breaker.record(failed=False, latency=latency)
+        return result
+
+    def _hedged(self, fn: Callable[[float], Any], expires: float) -> Any:
+        """Fire a second copy once the primary exceeds the tracked latency percentile."""
+        threshold = self.latency.percentile(self.hedge_percentile)
+        if threshold is None:
+            # Nothing to hedge against yet: run inline, no pool hop
+            return self._timed(fn, expires)
+
+        primary = _hedge_pool.submit(self._timed, fn, expires)
+        done, _ = wait([primary], timeout=min(threshold, max(expires - time.monotonic(), 0)))
+        if done:
+            return primary.result()
+
+        pending = {primary}
+        if time.monotonic() < expires and self.breaker.allow():
+            print(f"🏁 {self.name}: hedging after {threshold:.2f}s")
+            pending.add(_hedge_pool.submit(self._timed, fn, expires))
+
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = wait(
+                pending, timeout=max(expires - time.monotonic(), 0), return_when=FIRST_COMPLETED
+            )
+            if not done:
+                # Stragglers keep running in the pool, bounded by their own request timeout
+                raise self._deadline_exceeded()
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def snapshot(self) -> dict:
+        return {
+            "state": self.breaker.state,
+            "p95_seconds": self.latency.percentile(95),
+        }
+
+
+UPSTREAMS = {}
+
+
+def upstream(name: str, hedge_percentile: Optional[float] = None) -> Upstream:
+    if name not in UPSTREAMS:
+        UPSTREAMS[name] = Upstream(name, hedge_percentile=hedge_percentile)
+    return UPSTREAMS[name]
@@ -0,0 +1,129 @@
+import os
+import time
+import asyncio
+import threading
+from collections import deque
+from typing import Dict, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from services.ondemand import create_chat_session, send_chat_message
+from services.voice import text_to_speech
+
+load_dotenv()
+
+# Configuration
+OPENING_MESSAGE = "Hello, please state your name and income."
+INTERVIEW_USER_ID = os.getenv("INTERVIEW_USER_ID", "user_hackathon_1")
+SESSION_POOL_SIZE = int(os.getenv("SESSION_POOL_SIZE", "4"))
+SESSION_POOL_TTL = float(os.getenv("SESSION_POOL_TTL", "600"))
+SESSION_POOL_INTERVAL = float(os.getenv("SESSION_POOL_INTERVAL", "10"))
+SESSION_POOL_CONCURRENCY = int(os.getenv("SESSION_POOL_CONCURRENCY", "2"))
+
+# Replies that mean the exchange did not really happen
+FAILED_REPLIES = ("Error connecting to Agent.", "No text response.")
+
+
+class SessionPool:
+    """
+    Keeps SESSION_POOL_SIZE OnDemand chat sessions ready for /api/interview/start.
+    Each pooled session has already been sent the fixed opening message, so
+    taking one returns the agent's greeting with no network round trip.
+    Sessions older than SESSION_POOL_TTL are discarded; taking one triggers a refill.
+    """
+
+    def __init__(self, agent_id: str, target_size: int = SESSION_POOL_SIZE, ttl: float = SESSION_POOL_TTL):
+        self.agent_id = agent_id
+        self.target_size = target_size
+        self.ttl = ttl
+        self._ready = deque()  # (expires_at, session_id, opening_text)
+        self._lock = threading.Lock()
+        self._refill = asyncio.Event()
+        # Opening sends still running for sessions served from the cached greeting
+        self._openings: Dict[str, asyncio.Task] = {}
+        # Last good opening exchange, served when the pool is empty
+        self.opening_text: Optional[str] = None
+
+    def _evict_expired(self):
+        now = time.monotonic()
+        with self._lock:
+            while self._ready and self._ready[0][0] <= now:
+                self._ready.popleft()
+
+    def _prime_one(self) -> bool:
+        """Creates a session and runs the opening exchange on it (blocking)."""
+        sid = create_chat_session(INTERVIEW_USER_ID)
+        if not sid or sid == "mock-session-id":
+            return False
+        text = send_chat_message(sid, OPENING_MESSAGE, self.agent_id)
+        if not text or text in FAILED_REPLIES:
+            return False
+        # Warm the TTS cache so the greeting audio is instant too
+        text_to_speech(text)
+        with self._lock:
+            self._ready.append((time.monotonic() + self.ttl, sid, text))
+            self.opening_text = text
+        return True
+
+    def acquire(self) -> Optional[Tuple[str, str]]:
+        """Returns (session_id, opening_text) of a primed session, or None if the pool is empty."""
+        self._evict_expired()
+        with self._lock:
+            entry = self._ready.popleft() if self._ready else None
+        self._refill.set()
+        if entry is None:
+            return None
+        return entry[1], entry[2]
+
+    async def start_session(self) -> Tuple[str, str]:
+        """Interview start: pooled session if possible, otherwise a fresh one."""
+        pooled = self.acquire()
+        if pooled:
+            return pooled
+
+        print("ℹ️ Session pool empty. Creating session on demand.")
+        sid = await asyncio.to_thread(create_chat_session, INTERVIEW_USER_ID)
+        if self.opening_text and sid != "mock-session-id":
+            # Serve the cached greeting now; the agent still sees the opening in the background
+            task = asyncio.create_task(
+                asyncio.to_thread(send_chat_message, sid, OPENING_MESSAGE, self.agent_id)
+            )
+            self._openings[sid] = task
+            task.add_done_callback(lambda _: self._openings.pop(sid, None))
+            return sid, self.opening_text
+
+        text = await asyncio.to_thread(send_chat_message, sid, OPENING_MESSAGE, self.agent_id)
+        return sid, text
+
+    async def opening_sent(self, session_id: str):
+        """Waits for a background opening send, so the user's first message cannot overtake it."""
+        task = self._openings.get(session_id)
+        if task is None:
+            return
+        try:
+            await asyncio.shield(task)
+        except Exception as e:
+            print(f"⚠️ Opening message failed for {session_id}: {e}")
+
+    def size(self) -> int:
+        with self._lock:
+            return len(self._ready)
+
+    async def run(self):
+        """Background refill loop: tops the pool up every interval or right after an acquire."""
+        while True:
+            self._refill.clear()
+            self._evict_expired()
+            deficit = min(self.target_size - self.size(), SESSION_POOL_CONCURRENCY)
+            if deficit > 0:
+                primed = await asyncio.gather(
+                    *(asyncio.to_thread(self._prime_one) for _ in range(deficit)),
+                    return_exceptions=True
+                )
+                if any(p is True for p in primed) and self.size() < self.target_size:
+                    # Still short: keep filling without waiting for the interval
+                    continue
+            try:
+                await asyncio.wait_for(self._refill.wait(), timeout=SESSION_POOL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
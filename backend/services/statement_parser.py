@@ -0,0 +1,314 @@
+import os
+import re
+import csv
+import json
+from datetime import datetime, date
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+# Rows are buffered into fixed-size chunks and totalled with numpy,
+# so memory stays flat no matter how large the statement is.
+CHUNK_ROWS = int(os.getenv("STATEMENT_CHUNK_ROWS", "50000"))
+READ_SIZE = 1 << 20
+# A single JSON transaction larger than this is rejected instead of buffered
+MAX_JSON_ELEMENT = int(os.getenv("STATEMENT_MAX_JSON_ELEMENT", str(8 << 20)))
+
+STRUCTURED_EXTENSIONS = {".csv", ".ofx", ".qfx", ".json", ".jsonl", ".ndjson"}
+
+# Header / key aliases (lowercase)
+AMOUNT_FIELDS = ("amount", "transaction amount", "amt", "value", "trnamt")
+CREDIT_FIELDS = ("credit", "credits", "credit amount", "deposit", "deposits", "money in", "paid in")
+TYPE_FIELDS = ("type", "transaction type", "trntype", "cr/dr", "dr/cr", "direction")
+DATE_FIELDS = ("date", "transaction date", "posted date", "posting date", "value date", "dtposted", "booking date")
+
+CREDIT_TYPES = np.array(["credit", "cr", "c", "dep", "deposit", "directdep", "int", "interest", "div", "income"])
+DEBIT_TYPES = np.array(["debit", "dr", "d", "withdrawal", "payment", "pos", "atm", "check", "fee", "srvchg", "directdebit"])
+
+DATE_FORMATS = ("%Y-%m-%d", "%Y%m%d", "%d/%m/%Y", "%m/%d/%Y", "%d-%m-%Y", "%Y/%m/%d", "%d.%m.%Y")
+
+
+class StatementParseError(ValueError):
+    """The file looks structured but has no usable transaction columns."""
+
+
+def is_structured_statement(file_path: str) -> bool:
+    return os.path.splitext(file_path)[1].lower() in STRUCTURED_EXTENSIONS
+
+
+def _pick(fields: List[str], aliases: tuple) -> Optional[str]:
+    lowered = {f.lower().strip(): f for f in fields}
+    for alias in aliases:
+        if alias in lowered:
+            return lowered[alias]
+    return None
+
+
+def _parse_date(raw) -> Optional[date]:
+    if not raw:
+        return None
+    text = str(raw).strip()
+    for fmt in DATE_FORMATS:
+        try:
+            # OFX dates carry time + timezone suffixes: 20240315120000[-5:EST]
+            return datetime.strptime(text[:8] if fmt == "%Y%m%d" else text[:10], fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def _to_amounts(values: List[str]) -> np.ndarray:
+    """Vectorized '1,234.50' / '$(12.00)' / '' -> float64."""
+    arr = np.char.strip(np.asarray(values, dtype=np.str_))
+    negative = np.char.startswith(arr, "(")
+    for ch in ("$", "€", "£", "₹", ",", "(", ")", " "):
+        arr = np.char.replace(arr, ch, "")
+    arr[arr == ""] = "0"
+    try:
+        amounts = arr.astype(np.float64)
+    except ValueError:
+        # Rare junk cells: fall back to per-cell parsing for this chunk only
+        amounts = np.array([_safe_float(v) for v in arr], dtype=np.float64)
+    amounts[negative] *= -1
+    return amounts
+
+
+def _safe_float(value: str) -> float:
+    try:
+        return float(value)
+    except ValueError:
+        return 0.0
+
+
+class _LedgerTotals:
+    """Accumulates income over column chunks."""
+
+    def __init__(self):
+        self.income = 0.0
+        self.count = 0
+        self.latest: Optional[date] = None
+
+    def add_chunk(self, amounts=None, credits=None, types=None, dates=None):
+        if credits is not None:
+            values = _to_amounts(credits)
+            self.income += float(values[values > 0].sum())
+            self.count += len(values)
+        elif amounts is not None:
+            values = _to_amounts(amounts)
+            income_mask = values > 0
+            if types is not None:
+                kinds = np.char.lower(np.char.strip(np.asarray(types, dtype=np.str_)))
+                is_credit = np.isin(kinds, CREDIT_TYPES)
+                is_debit = np.isin(kinds, DEBIT_TYPES)
+                # Typed rows may carry unsigned amounts; untyped rows go by sign
+                income_mask = is_credit | (~is_debit & income_mask)
+                values = np.abs(values)
+            self.income += float(values[income_mask].sum())
+            self.count += len(values)
+
+        if dates:
+            # Statements are ordered; the chunk edges bound its date range
+            for candidate in (_parse_date(dates[0]), _parse_date(dates[-1])):
+                if candidate and (self.latest is None or candidate > self.latest):
+                    self.latest = candidate
+
+    def result(self, source_format: str) -> dict:
+        if self.count == 0:
+            raise StatementParseError("No transactions found")
+        return {
+            "verified_ledger_total": int(round(self.income)),
+            "date": (self.latest or date.today()).isoformat(),
+            "status": "verified_by_local_parser",
+            "transactions": self.count,
+            "format": source_format,
+        }
+
+
+def _column_keys(fields: List[str]) -> Dict[str, str]:
+    """Maps each add_chunk argument to the field that feeds it."""
+    amount = _pick(fields, AMOUNT_FIELDS)
+    credit = _pick(fields, CREDIT_FIELDS)
+    if amount is None and credit is None:
+        raise StatementParseError(f"No amount or credit column in {fields}")
+    keys = {
+        # A dedicated credit column beats a signed amount column
+        "amounts": None if credit else amount,
+        "credits": credit,
+        "types": _pick(fields, TYPE_FIELDS),
+        "dates": _pick(fields, DATE_FIELDS),
+    }
+    return {name: key for name, key in keys.items() if key is not None}
+
+
+def _chunks(records: Iterable) -> Iterator[list]:
+    it = iter(records)
+    while True:
+        chunk = list(islice(it, CHUNK_ROWS))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _add_rows(totals: _LedgerTotals, rows: list, keys: Dict[str, int]):
+    totals.add_chunk(**{name: [row[i] for row in rows] for name, i in keys.items()})
+
+
+def _add_records(totals: _LedgerTotals, records: List[dict], keys: Dict[str, str]):
+    columns = {}
+    for name, key in keys.items():
+        values = [record.get(key) for record in records]
+        columns[name] = ["" if v is None else str(v) for v in values]
+    totals.add_chunk(**columns)
+
+
+# --- Format readers ---
+def _parse_csv(file_path: str) -> dict:
+    totals = _LedgerTotals()
+    with open(file_path, "r", newline="", encoding="utf-8-sig", errors="replace") as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if not header:
+            raise StatementParseError("Empty CSV")
+        position = {name: i for i, name in enumerate(header)}
+        keys = {name: position[field] for name, field in _column_keys(header).items()}
+        width = len(header)
+        for rows in _chunks(row for row in reader if len(row) == width):
+            _add_rows(totals, rows, keys)
+    return totals.result("csv")
+
+
+OFX_TAG = re.compile(r"<(/?)([A-Za-z0-9.]+)>([^<]*)")
+OFX_FIELDS = ("TRNAMT", "TRNTYPE", "DTPOSTED")
+
+
+def _iter_ofx_transactions(f) -> Iterator[dict]:
+    """OFX 1.x (SGML, closing tags optional) and 2.x (XML) <STMTTRN> blocks."""
+    current: Optional[dict] = None
+    carry = ""
+    while True:
+        chunk = f.read(READ_SIZE)
+        text = carry + chunk
+        # Hold back the trailing (possibly cut) tag for the next read
+        cut = max(text.rfind("<"), 0) if chunk else len(text)
+        carry, text = text[cut:], text[:cut]
+        for closing, tag, value in OFX_TAG.findall(text):
+            tag = tag.upper()
+            if tag == "STMTTRN":
+                if current and "TRNAMT" in current:
+                    yield current
+                current = None if closing else {}
+            elif current is not None and not closing and tag in OFX_FIELDS:
+                current[tag] = value.strip()
+        if not chunk:
+            break
+    if current and "TRNAMT" in current:
+        yield current
+
+
+def _parse_ofx(file_path: str) -> dict:
+    totals = _LedgerTotals()
+    keys = {"amounts": "TRNAMT", "types": "TRNTYPE", "dates": "DTPOSTED"}
+    with open(file_path, "r", encoding="utf-8", errors="replace") as f:
+        for records in _chunks(_iter_ofx_transactions(f)):
+            _add_records(totals, records, keys)
+    return totals.result("ofx")
+
+
+def _iter_json_array(f, buf: str, pos: int) -> Iterator[dict]:
+    """Yields objects of a JSON array whose '[' ends at buf[pos-1], reading as needed."""
+    decoder = json.JSONDecoder()
+    while True:
+        while pos < len(buf) and buf[pos] in " \t\r\n,":
+            pos += 1
+        if pos >= len(buf):
+            more = f.read(READ_SIZE)
+            if not more:
+                raise StatementParseError("Unterminated JSON array")
+            buf, pos = buf[pos:] + more, 0
+            continue
+        if buf[pos] == "]":
+            return
+        try:
+            item, pos = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError as e:
+            # The element may just be cut off by the read boundary (also mid-literal,
+            # where the error points at the literal's start): read more until EOF
+            # or until the element outgrows MAX_JSON_ELEMENT
+            if len(buf) - pos > MAX_JSON_ELEMENT:
+                raise StatementParseError(f"JSON transaction larger than {MAX_JSON_ELEMENT} bytes") from e
+            more = f.read(READ_SIZE)
+            if not more:
+                raise StatementParseError(f"Malformed JSON transaction: {e}") from e
+            buf, pos = buf[pos:] + more, 0
+            continue
+        yield item
+
+
+def _iter_json_records(f) -> Iterator[dict]:
+    head = f.read(READ_SIZE)
+    stripped = head.lstrip()
+    if stripped.startswith("["):
+        yield from _iter_json_array(f, head, head.index("[") + 1)
+        return
+
+    f.seek(0)
+    try:
+        json.loads(f.readline(READ_SIZE))
+        is_ndjson = True
+    except json.JSONDecodeError:
+        is_ndjson = False
+
+    if is_ndjson:
+        # One record per line
+        f.seek(0)
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            # A single-line {"transactions": [...]} export
+            if isinstance(record, dict) and isinstance(record.get("transactions"), list):
+                yield from record["transactions"]
+            else:
+                yield record
+        return
+
+    # {"...": ..., "transactions": [ ... ]}
+    f.seek(0)
+    buf = f.read(READ_SIZE)
+    while True:
+        match = re.search(r'"transactions"\s*:\s*\[', buf, re.IGNORECASE)
+        if match:
+            yield from _iter_json_array(f, buf, match.end())
+            return
+        more = f.read(READ_SIZE)
+        if not more:
+            raise StatementParseError("No transactions array in JSON")
+        buf = buf[-64:] + more
+
+
+def _parse_json(file_path: str) -> dict:
+    totals = _LedgerTotals()
+    keys: Optional[Dict[str, str]] = None
+    with open(file_path, "r", encoding="utf-8", errors="replace") as f:
+        records = (r for r in _iter_json_records(f) if isinstance(r, dict))
+        for chunk in _chunks(records):
+            if keys is None:
+                keys = _column_keys(list(chunk[0].keys()))
+            _add_records(totals, chunk, keys)
+    return totals.result("json")
+
+
+def parse_statement(file_path: str) -> dict:
+    """
+    Local Auditor: streams a CSV / OFX / JSON statement and totals its income.
+    Returns the same shape as ondemand.analyze_document.
+    """
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext == ".csv":
+        return _parse_csv(file_path)
+    if ext in (".ofx", ".qfx"):
+        return _parse_ofx(file_path)
+    if ext in (".json", ".jsonl", ".ndjson"):
+        return _parse_json(file_path)
+    raise StatementParseError(f"Unsupported statement format: {ext}")
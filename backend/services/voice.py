@@ -2,11 +2,29 @@
 import os
 import requests
 import base64
+import threading
+from collections import OrderedDict
+from services.resilience import upstream
 
 ELEVEN_API_KEY = os.getenv("ELEVEN_API_KEY")
+TTS_TIMEOUT = float(os.getenv("TTS_TIMEOUT", "20"))
+
+# Synthesis is a pure function of the text, so slow calls may be hedged, but every
+# hedge is billed again: off unless ELEVENLABS_HEDGE_PERCENTILE is set (e.g. 95)
+tts_upstream = upstream("elevenlabs")
+
+# Same reasoning: successful clips are cached by text (e.g. the fixed interview opening)
+TTS_CACHE_SIZE = int(os.getenv("TTS_CACHE_SIZE", "64"))
+_tts_cache = OrderedDict()
+_tts_cache_lock = threading.Lock()
 
 def text_to_speech(text: str):
     """Converts Agent response to Audio"""
+    with _tts_cache_lock:
+        if text in _tts_cache:
+            _tts_cache.move_to_end(text)
+            return _tts_cache[text]
+
     url = "https://api.elevenlabs.io/v1/text-to-speech/21m00Tcm4TlvDq8ikWAM"
     headers = {
         "xi-api-key": ELEVEN_API_KEY,
@@ -14,7 +32,22 @@ def text_to_speech(text: str):
     }
     data = {"text": text, "model_id": "eleven_monolingual_v1"}
     
-    response = requests.post(url, headers=headers, json=data)
+    def _synthesize(timeout):
+        res = requests.post(url, headers=headers, json=data, timeout=timeout)
+        res.raise_for_status()
+        return res
+
+    try:
+        response = tts_upstream.call(_synthesize, deadline=TTS_TIMEOUT, idempotent=True)
+    except Exception as e:
+        print(f"⚠️ TTS Error: {e}")
+        return None
+
     if response.status_code == 200:
-        return base64.b64encode(response.content).decode('utf-8')
+        audio = base64.b64encode(response.content).decode('utf-8')
+        with _tts_cache_lock:
+            _tts_cache[text] = audio
+            while len(_tts_cache) > TTS_CACHE_SIZE:
+                _tts_cache.popitem(last=False)
+        return audio
     return None
\ No newline at end of file
@@ -0,0 +1,52 @@
+import io
+import json
+
+import pytest
+
+from services import statement_parser
+from services.statement_parser import StatementParseError, parse_statement
+
+
+def _records(n):
+    return [
+        {"date": "2024-03-15", "amount": f"{i}.50", "type": "credit", "pending": False, "memo": None}
+        for i in range(n)
+    ]
+
+
+def test_json_array_split_across_reads(tmp_path, monkeypatch):
+    # Tiny reads put boundaries inside literals, strings and numbers
+    monkeypatch.setattr(statement_parser, "READ_SIZE", 7)
+    records = _records(200)
+    path = tmp_path / "statement.json"
+    path.write_text(json.dumps(records))
+
+    result = parse_statement(str(path))
+
+    assert result["transactions"] == 200
+    assert result["verified_ledger_total"] == round(sum(float(r["amount"]) for r in records))
+
+
+def test_json_transactions_key_split_across_reads(tmp_path, monkeypatch):
+    monkeypatch.setattr(statement_parser, "READ_SIZE", 11)
+    path = tmp_path / "statement.json"
+    path.write_text(json.dumps({"account": "x", "transactions": _records(50)}))
+
+    assert parse_statement(str(path))["transactions"] == 50
+
+
+def test_json_array_malformed_element_is_bounded(monkeypatch):
+    monkeypatch.setattr(statement_parser, "READ_SIZE", 16)
+    monkeypatch.setattr(statement_parser, "MAX_JSON_ELEMENT", 256)
+    body = '{"amount": "1"}, {"amount": oops}, ' + '{"amount": "2"}, ' * 10000 + "]"
+    f = io.StringIO(body)
+
+    with pytest.raises(StatementParseError):
+        list(statement_parser._iter_json_array(f, "", 0))
+    # Gave up long before reading the whole file
+    assert f.tell() < 1024
+
+
+def test_json_array_malformed_at_eof():
+    with pytest.raises(StatementParseError):
+        list(statement_parser._iter_json_array(io.StringIO('{"amount": "1"}, {"amount": oops}]'), "", 0))